@@ -0,0 +1,86 @@
+"""保存済みの問い合わせやJSONLの回答をまとめて見積もり直すCLI
+
+    # estimate_data の全件を見積もり直して書き戻す（中断しても同じコマンドで再開できる）
+    python -m app.cli.batch_estimate run --source db --output db --checkpoint estimate_batch.ckpt
+
+    # JSONL（1行1件の {"id": ..., "answers": {...}}）を処理して結果をJSONLに書き出す
+    python -m app.cli.batch_estimate run --source answers.jsonl --output results.jsonl --concurrency 8
+
+    # OpenAI Batch API を使う場合: リクエストを書き出し、結果のファイルを指定して取り込む
+    python -m app.cli.batch_estimate export --source db --output batch_requests.jsonl
+    python -m app.cli.batch_estimate run --source db --output db --batch-results batch_output.jsonl
+"""
+import argparse
+import asyncio
+import logging
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from app.services.batch_estimate import (
+    BATCH_CONCURRENCY,
+    BATCH_FLUSH_SIZE,
+    Checkpoint,
+    DatabaseSink,
+    JsonlSink,
+    export_batch_requests,
+    iter_estimate_items,
+    iter_jsonl_items,
+    load_batch_responses,
+    run_batch,
+)
+from app.services.llm import close_client
+
+logger = logging.getLogger(__name__)
+
+
+def _items(source: str):
+    return iter_estimate_items() if source == "db" else iter_jsonl_items(source)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="見積もりを実行して結果を書き込む")
+    run_parser.add_argument("--source", required=True, help="'db'（estimate_data）またはJSONLファイルのパス")
+    run_parser.add_argument("--output", required=True, help="'db'（一括で書き戻す）またはJSONLファイルのパス")
+    run_parser.add_argument("--checkpoint", help="処理済みIDを記録するファイル（再開に使う）")
+    run_parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY)
+    run_parser.add_argument("--flush-size", type=int, default=BATCH_FLUSH_SIZE)
+    run_parser.add_argument("--mode", choices=["fanout", "combined"])
+    run_parser.add_argument("--batch-results", help="OpenAI Batch API の出力ファイル（LLMを呼び出さずにこの結果を使う）")
+
+    export_parser = subparsers.add_parser("export", help="OpenAI Batch API の入力ファイルを書き出す")
+    export_parser.add_argument("--source", required=True)
+    export_parser.add_argument("--output", required=True)
+    export_parser.add_argument("--checkpoint", help="処理済みのIDを除外する")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    try:
+        if args.command == "export":
+            count = await export_batch_requests(_items(args.source), args.output, Checkpoint(args.checkpoint))
+            logger.info("Wrote %d requests to %s", count, args.output)
+            return
+
+        sink = DatabaseSink() if args.output == "db" else JsonlSink(args.output)
+        responses = load_batch_responses(args.batch_results) if args.batch_results else None
+        stats = await run_batch(
+            _items(args.source),
+            sink,
+            Checkpoint(args.checkpoint),
+            concurrency=args.concurrency,
+            mode=args.mode,
+            responses=responses,
+            flush_size=args.flush_size,
+        )
+        logger.info("Batch finished: %s", stats)
+    finally:
+        await close_client()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,59 @@
+"""生成ドキュメントの圧縮（ESTIMATE_COMPRESSION=zstd）に使う辞書を学習するCLI
+
+    # テンプレートと estimate_data の保存済みドキュメントから学習する
+    python -m app.cli.train_compression_dictionary --output estimate.zdict --from-db 2000
+
+書き出した辞書は ESTIMATE_ZSTD_DICTIONARY に指定する。辞書を作り直すときは新しいファイルを先頭に追加し、
+古い辞書で圧縮した行を読めるよう古いファイルも残しておく（ESTIMATE_ZSTD_DICTIONARY=new.zdict,old.zdict）。
+"""
+import argparse
+import logging
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from sqlalchemy import select
+from sqlalchemy.orm import undefer_group
+
+from app.services.compression import template_samples, train_dictionary
+from app.services.templates import TEMPLATE_DIR
+
+logger = logging.getLogger(__name__)
+
+DOCUMENT_COLUMNS = ("requirements_specification", "requirements_definition", "estimate_develop")
+
+
+def database_samples(limit: int):
+    # 新しい行から順に、生成ドキュメントを学習用サンプルにする
+    from app.database import SessionLocal
+    from app.models.estimate import Estimate
+
+    samples = []
+    with SessionLocal() as db:
+        query = select(Estimate).options(undefer_group("documents")).order_by(Estimate.id.desc()).limit(limit)
+        for row in db.execute(query).scalars():
+            samples.extend(getattr(row, column).encode("utf-8") for column in DOCUMENT_COLUMNS if getattr(row, column))
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--output", required=True, help="辞書の書き出し先")
+    parser.add_argument("--size", type=int, default=32 * 1024, help="辞書のサイズ（バイト）")
+    parser.add_argument("--template-dir", default=TEMPLATE_DIR)
+    parser.add_argument("--from-db", type=int, default=0, metavar="ROWS", help="estimate_data から読み込む行数")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    samples = template_samples(args.template_dir)
+    if args.from_db:
+        samples.extend(database_samples(args.from_db))
+    dictionary = train_dictionary(samples, args.size)
+    with open(args.output, "wb") as f:
+        f.write(dictionary)
+    logger.info("Trained a %d byte dictionary from %d samples: %s", len(dictionary), len(samples), args.output)
+
+
+if __name__ == "__main__":
+    main()
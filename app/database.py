@@ -1,18 +1,52 @@
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from starlette.concurrency import run_in_threadpool
 import os
+import time
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-engine = create_engine(DATABASE_URL)
+# コネクションプールの設定（SQLiteではプールサイズ指定が使えないため除外する）
+engine_options = {"pool_pre_ping": os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"}
+if DATABASE_URL and not DATABASE_URL.startswith("sqlite"):
+    engine_options.update(
+        pool_size=int(os.getenv("DB_POOL_SIZE", "5")),
+        max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "10")),
+        pool_timeout=float(os.getenv("DB_POOL_TIMEOUT", "30")),
+        pool_recycle=int(os.getenv("DB_POOL_RECYCLE", "1800")),
+    )
+
+engine = create_engine(DATABASE_URL, **engine_options)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
+# run_db の所要時間を受け取る関数 (operation, duration, failed)。メトリクスの記録はサービス層で登録する
+_operation_observers = []
+
+def add_operation_observer(observer):
+    _operation_observers.append(observer)
+    return observer
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+async def run_db(func, *args, **kwargs):
+    # 同期的なDB処理をスレッドプールで実行し、イベントループをブロックしない
+    operation = getattr(func, "__name__", "db").lstrip("_")
+    started = time.perf_counter()
+    failed = False
+    try:
+        return await run_in_threadpool(func, *args, **kwargs)
+    except Exception:
+        failed = True
+        raise
+    finally:
+        duration = time.perf_counter() - started
+        for observer in _operation_observers:
+            observer(operation, duration, failed)
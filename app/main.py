@@ -1,24 +1,63 @@
 import os
+import asyncio
 import logging
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
+
+# .envファイルを読み込む（各モジュールが読み込み時に環境変数を参照するため、最初に行う）
+load_dotenv()
+
 from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from app.routers import form, screen
+from app.routers import form, screen, jobs, metrics, estimate_search, preview
 from app.routers import estimate as estimate_router
-from app.middleware.content_security_policy import ContentSecurityPolicyMiddleware
-from app.database import engine, get_db
+from app.middleware.compression import CompressionMiddleware
+from app.middleware.content_security_policy import PREVIEW_POLICY, ContentSecurityPolicyMiddleware
+from app.middleware.server_timing import ServerTimingMiddleware
+from app.database import add_operation_observer, engine, get_db, run_db
 from app.models import estimate as estimate_model
+from app.models import form as form_model  # noqa: F401 テーブル定義の登録
+from app.services.templates import template_registry
+from app.services.llm import close_client, preload_client_modules
+from app.services.estimate import job_manager
+from app.services.screen_prefetch import screen_prefetcher
+from app.services.llm_logging import setup_logging
+from app.services.metrics import record_db_operation
 
-# .envファイルを読み込む
-load_dotenv()
+# ロギングの設定（LOG_LEVELで変更可能）
+setup_logging()
+logger = logging.getLogger(__name__)
 
-# ロギングの設定
-logging.basicConfig(level=logging.INFO)
+# DB処理の所要時間をメトリクスと Server-Timing に記録する
+add_operation_observer(record_db_operation)
 
-app = FastAPI()
+DB_CREATE_ALL = os.getenv("DB_CREATE_ALL", "true").lower() == "true"
 
-# モデルに基づいてテーブルを作成
-estimate_model.Base.metadata.create_all(bind=engine)
+async def create_tables():
+    # モデルに基づいてテーブルを作成（DBが一時的に落ちていても起動は継続する）
+    try:
+        await run_db(estimate_model.Base.metadata.create_all, bind=engine)
+    except Exception:
+        logger.exception("Failed to create database tables; continuing startup")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # テンプレートを起動時に一度だけ読み込む（不足していれば起動を失敗させる）
+    template_registry.load()
+    background = []
+    if DB_CREATE_ALL:
+        background.append(asyncio.create_task(create_tables()))
+    # 重いモジュールは起動後にバックグラウンドで読み込み、最初のリクエストの遅延を避ける
+    background.append(asyncio.create_task(run_db(preload_client_modules)))
+    await job_manager.start()
+    yield
+    await job_manager.stop()
+    screen_prefetcher.stop()
+    for task in background:
+        task.cancel()
+    await close_client()
+
+app = FastAPI(lifespan=lifespan)
 
 # CORSミドルウェアの設定
 origins = [
@@ -38,13 +77,23 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Content-Security-Policy ミドルウェアを追加
-app.add_middleware(ContentSecurityPolicyMiddleware)
+# Content-Security-Policy ミドルウェアを追加（生成したプレビューのHTMLには専用のポリシーを使う）
+app.add_middleware(ContentSecurityPolicyMiddleware, route_policies={"/previews/": PREVIEW_POLICY})
+
+# 処理時間を Server-Timing ヘッダーで返すミドルウェアを追加
+app.add_middleware(ServerTimingMiddleware)
+
+# 大きなレスポンスを圧縮するミドルウェアを追加（SSE・NDJSONのストリーミングは圧縮しない）
+app.add_middleware(CompressionMiddleware)
 
 # ルーターを追加
 app.include_router(form.router)
 app.include_router(estimate_router.router)
 app.include_router(screen.router)
+app.include_router(jobs.router)
+app.include_router(metrics.router)
+app.include_router(estimate_search.router)
+app.include_router(preview.router)
 
 @app.get("/")
 async def root():
@@ -0,0 +1,104 @@
+import gzip
+import os
+
+# 圧縮する最小のレスポンスサイズ（バイト）と圧縮レベル
+COMPRESSION_MINIMUM_SIZE = int(os.getenv("COMPRESSION_MINIMUM_SIZE", "1024"))
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "5"))
+# 逐次送るレスポンスは圧縮するとバッファリングで届くのが遅れるため対象外にする
+EXCLUDED_CONTENT_TYPES = ("text/event-stream", "application/x-ndjson")
+
+try:
+    import brotli
+except ImportError:  # requirements.txt に含まれるが、入っていない環境では gzip のみ
+    brotli = None
+
+
+def _accepted_encoding(accept_encoding: str):
+    encodings = set()
+    for item in accept_encoding.split(","):
+        name, _, params = item.partition(";")
+        quality = params.strip()
+        try:
+            # "gzip;q=0" は拒否の指定
+            if quality.startswith("q=") and float(quality[2:]) == 0:
+                continue
+        except ValueError:
+            continue
+        encodings.add(name.strip().lower())
+    if brotli is not None and "br" in encodings:
+        return "br"
+    if "gzip" in encodings:
+        return "gzip"
+    return None
+
+
+def _compress(encoding: str, body: bytes) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=COMPRESSION_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=COMPRESSION_GZIP_LEVEL)
+
+
+class CompressionMiddleware:
+    """一度に返すレスポンスを brotli（インストール済みの場合）または gzip で圧縮するASGIミドルウェア
+
+    本体が複数回に分かれるストリーミングのレスポンスと EXCLUDED_CONTENT_TYPES はそのまま流す。
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MINIMUM_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = ""
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+        encoding = _accepted_encoding(accept_encoding)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        passthrough = False
+
+        async def send_with_compression(message):
+            nonlocal start_message, passthrough
+            if message["type"] == "http.response.start":
+                headers = {name.lower(): value for name, value in message.get("headers", [])}
+                content_type = headers.get(b"content-type", b"").decode("latin-1")
+                passthrough = b"content-encoding" in headers or content_type.startswith(EXCLUDED_CONTENT_TYPES)
+                if passthrough:
+                    await send(message)
+                else:
+                    # 本体を見てから圧縮するかを決めるため、ヘッダーの送信を遅らせる
+                    start_message = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            passthrough = True
+            body = message.get("body", b"")
+            headers = list(start_message.get("headers", []))
+            if message.get("more_body", False) or len(body) < self.minimum_size:
+                await send(start_message)
+                await send(message)
+                return
+
+            body = _compress(encoding, body)
+            headers = [(name, value) for name, value in headers if name.lower() not in (b"content-length", b"vary")]
+            vary = [value for name, value in start_message.get("headers", []) if name.lower() == b"vary"]
+            headers += [
+                (b"content-encoding", encoding.encode("latin-1")),
+                (b"content-length", str(len(body)).encode("latin-1")),
+                (b"vary", b", ".join(vary + [b"Accept-Encoding"])),
+            ]
+            await send({**start_message, "headers": headers})
+            await send({**message, "body": body})
+
+        await self.app(scope, receive, send_with_compression)
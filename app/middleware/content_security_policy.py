@@ -1,7 +1,53 @@
-from starlette.middleware.base import BaseHTTPMiddleware
+DEFAULT_POLICY = "default-src 'self'; connect-src 'self' https://smartspeztech.com https://*.cloudfront.net http: https:;"
+# LLMが生成したプレビューのHTML（GET /previews/{id}）用。sandbox でAPIのオリジンとは別扱いにして実行する
+PREVIEW_POLICY = (
+    "default-src 'none'; script-src 'unsafe-inline' https://cdn.tailwindcss.com; "
+    "style-src 'unsafe-inline' https:; img-src https: data:; font-src https: data:; sandbox allow-scripts allow-modals;"
+)
 
-class ContentSecurityPolicyMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request, call_next):
-        response = await call_next(request)
-        response.headers["Content-Security-Policy"] = "default-src 'self'; connect-src 'self' https://smartspeztech.com https://*.cloudfront.net http: https:;"
-        return response
\ No newline at end of file
+
+class ContentSecurityPolicyMiddleware:
+    """Content-Security-Policy ヘッダーを付与するASGIミドルウェア
+
+    BaseHTTPMiddleware と違いレスポンス本体には触れないため、ストリーミング/SSEもそのまま流れる。
+    route_policies にはパスの前方一致でポリシーを指定する（None を指定したパスにはヘッダーを付けない）。
+    """
+
+    def __init__(self, app, policy: str = DEFAULT_POLICY, route_policies=None):
+        self.app = app
+        # ヘッダー値はリクエストごとにエンコードしないよう起動時にバイト列にしておく
+        self.default_header = policy.encode("latin-1")
+        self.route_headers = sorted(
+            (
+                (prefix, value.encode("latin-1") if value is not None else None)
+                for prefix, value in (route_policies or {}).items()
+            ),
+            key=lambda item: len(item[0]),
+            reverse=True,
+        )
+
+    def header_for(self, path: str):
+        for prefix, header in self.route_headers:
+            if path.startswith(prefix):
+                return header
+        return self.default_header
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        header = self.header_for(scope["path"])
+        if header is None:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_csp(message):
+            if message["type"] == "http.response.start":
+                # エンドポイント側で設定済みの値は上書きする
+                headers = [(name, value) for name, value in message.get("headers", []) if name.lower() != b"content-security-policy"]
+                headers.append((b"content-security-policy", header))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        await self.app(scope, receive, send_with_csp)
@@ -0,0 +1,33 @@
+import time
+from app.services.metrics import start_server_timing
+
+
+class ServerTimingMiddleware:
+    """LLM呼び出しやDB処理の所要時間を Server-Timing ヘッダーで返すASGIミドルウェア"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = start_server_timing()
+        started = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                # 同じ処理名は合計し、呼び出し回数を説明に含める
+                totals = {}
+                for name, duration in timings:
+                    total, count = totals.get(name, (0.0, 0))
+                    totals[name] = (total + duration, count + 1)
+                entries = [f'{name};dur={total * 1000:.1f};desc="x{count}"' for name, (total, count) in totals.items()]
+                entries.append(f"total;dur={(time.perf_counter() - started) * 1000:.1f}")
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", ", ".join(entries).encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        await self.app(scope, receive, send_with_timing)
@@ -0,0 +1,109 @@
+"""estimate_data を検索APIに対応したスキーマへ移行する（何度実行してもよい）
+
+    python -m app.migrations.estimate_search --batch-size 5000
+
+- answers（JSONB）・created_at カラムを追加する
+- screens をテキストからJSONBに変換する（PostgreSQL）
+- 旧データで analysis に入っているフォーム回答のJSONを answers に移す（id範囲ごとに分割して更新）
+- pg_trgm を有効にし、問い合わせ・要件のテキストにGINインデックスを作成する（CONCURRENTLY）
+  （ESTIMATE_COMPRESSION を有効にしている場合は問い合わせのみ。要件のインデックスは削除する）
+"""
+import argparse
+import logging
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from sqlalchemy import inspect, text
+
+from app.database import engine
+from app.models.estimate import SEARCHABLE_COLUMNS, TEXT_SEARCH_COLUMNS, Estimate
+
+logger = logging.getLogger(__name__)
+
+TABLE = Estimate.__tablename__
+
+
+def _add_missing_columns(conn, columns, is_postgres: bool):
+    if "answers" not in columns:
+        conn.execute(text(f"ALTER TABLE {TABLE} ADD COLUMN answers {'JSONB' if is_postgres else 'JSON'}"))
+        logger.info("Added column %s.answers", TABLE)
+    if "created_at" not in columns:
+        # 既存の行は作成日時が分からないため NULL のままにする
+        conn.execute(text(f"ALTER TABLE {TABLE} ADD COLUMN created_at TIMESTAMP"))
+        if is_postgres:
+            conn.execute(text(f"ALTER TABLE {TABLE} ALTER COLUMN created_at SET DEFAULT now()"))
+        logger.info("Added column %s.created_at", TABLE)
+
+
+def _convert_screens(conn, columns, is_postgres: bool):
+    # SQLiteではJSON型もテキストとして保存されるため変換は不要
+    if is_postgres and str(columns["screens"]["type"]).upper() == "TEXT":
+        conn.execute(text(f"ALTER TABLE {TABLE} ALTER COLUMN screens TYPE JSONB USING NULLIF(screens, '')::jsonb"))
+        logger.info("Converted %s.screens to JSONB", TABLE)
+
+
+def _backfill_answers(is_postgres: bool, batch_size: int):
+    # 長時間のロックを避けるため、id の範囲ごとに別トランザクションで更新する
+    value = "analysis::jsonb" if is_postgres else "analysis"
+    valid = "analysis LIKE '{%'" if is_postgres else "json_valid(analysis)"
+    with engine.connect() as conn:
+        max_id = conn.execute(text(f"SELECT COALESCE(MAX(id), 0) FROM {TABLE}")).scalar()
+    updated = 0
+    for start in range(0, max_id, batch_size):
+        with engine.begin() as conn:
+            result = conn.execute(
+                text(
+                    f"UPDATE {TABLE} SET answers = {value} "
+                    f"WHERE id > :start AND id <= :end AND answers IS NULL AND {valid}"
+                ),
+                {"start": start, "end": start + batch_size},
+            )
+            updated += result.rowcount
+    logger.info("Backfilled answers for %d rows", updated)
+
+
+def _create_search_indexes():
+    # CONCURRENTLY はトランザクション外で実行する必要がある
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        for column in SEARCHABLE_COLUMNS:
+            conn.execute(text(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_{TABLE}_{column}_trgm "
+                f"ON {TABLE} USING gin ({column} gin_trgm_ops)"
+            ))
+        # 圧縮を有効にして検索対象から外れたカラムのインデックスは使われないため削除する
+        for column in TEXT_SEARCH_COLUMNS:
+            if column not in SEARCHABLE_COLUMNS:
+                conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS ix_{TABLE}_{column}_trgm"))
+        conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_{TABLE}_created_at ON {TABLE} (created_at)"))
+    logger.info("Created search indexes on %s", TABLE)
+
+
+def migrate(batch_size: int = 5000):
+    is_postgres = engine.dialect.name == "postgresql"
+    inspector = inspect(engine)
+    if not inspector.has_table(TABLE):
+        Estimate.__table__.create(bind=engine)
+        logger.info("Created table %s", TABLE)
+        return
+
+    columns = {column["name"]: column for column in inspector.get_columns(TABLE)}
+    with engine.begin() as conn:
+        _add_missing_columns(conn, columns, is_postgres)
+        _convert_screens(conn, columns, is_postgres)
+    _backfill_answers(is_postgres, batch_size)
+    if is_postgres:
+        _create_search_indexes()
+    else:
+        with engine.begin() as conn:
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{TABLE}_created_at ON {TABLE} (created_at)"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    migrate(args.batch_size)
@@ -1,5 +1,34 @@
-from sqlalchemy import Column, Integer, String, Text
+from sqlalchemy import JSON, Column, DateTime, DDL, Index, Integer, String, Text, event, func
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import deferred
+from sqlalchemy.types import TypeDecorator
 from app.database import Base  # Baseはdatabase.pyで宣言したdeclarative_base()
+from app.services import compression
+
+# PostgreSQLではJSONB、それ以外（SQLiteなど）では汎用のJSON型として保存する
+JSONType = JSON().with_variant(JSONB(), "postgresql")
+
+class CompressedText(TypeDecorator):
+    """ESTIMATE_COMPRESSION の設定に従って圧縮して保存し、読み込み時に展開するテキスト"""
+
+    impl = Text
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return compression.document_codec.encode(value)
+
+    def process_result_value(self, value, dialect):
+        return compression.document_codec.decode(value)
+
+    def coerce_compared_value(self, op, value):
+        # LIKE などの比較対象の値は圧縮しない
+        return Text()
+
+# 部分一致検索の対象にできる長文カラム（PostgreSQLではpg_trgmのGINインデックスを張る）
+TEXT_SEARCH_COLUMNS = ("inquiry", "requirements_specification", "requirements_definition")
+# 圧縮して保存した生成ドキュメントは本文で検索できないため、圧縮が有効な場合は問い合わせだけを対象にする
+# （一部の行だけが一致する不完全な結果を返さないよう、平文の旧データが残っていても対象から外す）
+SEARCHABLE_COLUMNS = TEXT_SEARCH_COLUMNS if compression.ESTIMATE_COMPRESSION == "none" else ("inquiry",)
 
 class Estimate(Base):
     __tablename__ = 'estimate_data'  # テーブル名
@@ -8,8 +37,28 @@ class Estimate(Base):
     name = Column(String, index=True)
     email = Column(String, index=True)
     inquiry = Column(Text)
-    requirements_specification = Column(Text)
-    requirements_definition = Column(Text)
-    screens = Column(Text)
-    estimate_develop = Column(Text)
-    analysis = Column(Text)
+    # 生成ドキュメントは一覧の取得で読み込まないよう遅延読み込みにする（undefer_group("documents") でまとめて読む）
+    requirements_specification = deferred(Column(CompressedText), group="documents")
+    requirements_definition = deferred(Column(CompressedText), group="documents")
+    screens = Column(JSONType)
+    estimate_develop = deferred(Column(CompressedText), group="documents")
+    analysis = deferred(Column(CompressedText), group="documents")  # 旧データではフォームの回答のJSON文字列が入っている
+    answers = Column(JSONType)
+    created_at = Column(DateTime, default=func.now(), server_default=func.now(), index=True)
+
+    __table_args__ = tuple(
+        Index(
+            f"ix_estimate_data_{column}_trgm",
+            column,
+            postgresql_using="gin",
+            postgresql_ops={column: "gin_trgm_ops"},
+        ).ddl_if(dialect="postgresql")
+        for column in SEARCHABLE_COLUMNS
+    )
+
+# トライグラムインデックスの作成前に拡張を有効にする
+event.listen(
+    Estimate.__table__,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"),
+)
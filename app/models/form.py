@@ -0,0 +1,9 @@
+from sqlalchemy import Column, DateTime, String, Text, func
+from app.database import Base
+
+class SavedForm(Base):
+    __tablename__ = 'form_data'  # 保存されたフォーム回答
+
+    id = Column(String(36), primary_key=True)
+    answers = Column(Text, nullable=False)  # 回答リストのJSON
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now(), index=True)
@@ -1,21 +1,52 @@
-from fastapi import APIRouter, HTTPException
+import json
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+from app.database import get_db
 from app.schemas.estimate import EstimateRequest, InquiryRequest, PreviewRequest
-from app.services.estimate import generate_estimate, save_inquiry_data, generate_preview
+from app.services.estimate import generate_estimate, save_inquiry_data, generate_preview, iter_estimate_events
+from app.services.html_preview import split_shared_assets
 
 router = APIRouter()
 
 @router.post("/estimate")
-async def estimate(request: EstimateRequest):
-    return await generate_estimate(request.answers)
+async def estimate(request: EstimateRequest, mode: Optional[str] = Query(None, pattern="^(fanout|combined)$"),
+                   prefetch: bool = False):
+    # mode を省略した場合は ESTIMATE_MODE の設定に従う。prefetch=true で上位の画面の詳細を先読みする
+    return await generate_estimate(request.answers, mode=mode, form_id=request.form_id, prefetch_screens=prefetch)
+
+@router.post("/estimate/stream")
+async def estimate_stream(
+    request: EstimateRequest,
+    format: str = Query("sse", pattern="^(sse|ndjson)$"),
+    stream_tokens: bool = False,
+):
+    # 各セクションを完了した順にSSEまたはNDJSONで返す
+    async def body():
+        async for event, data in iter_estimate_events(request.answers, stream_tokens=stream_tokens):
+            payload = json.dumps(data, ensure_ascii=False)
+            if format == "sse":
+                yield f"event: {event}\ndata: {payload}\n\n"
+            else:
+                yield json.dumps({"event": event, **data}, ensure_ascii=False) + "\n"
+
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    return StreamingResponse(body(), media_type=media_type, headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @router.post("/submit_inquiry")
-async def submit_inquiry(request: InquiryRequest):
+async def submit_inquiry(request: InquiryRequest, db: Session = Depends(get_db)):
     try:
-        await save_inquiry_data(request)
+        await save_inquiry_data(request, db)
         return {"message": "Inquiry submitted successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
 @router.post("/preview")
-async def estimate(request: PreviewRequest):
-    return await generate_preview(request.answers)
\ No newline at end of file
+async def estimate(request: PreviewRequest, shared_assets: bool = False):
+    results = await generate_preview(request.answers)
+    if not shared_assets:
+        return results
+    # 全画面で共通の script / stylesheet（Tailwind CDN など）は assets として1回だけ返す
+    assets, previews = split_shared_assets([result["preview"] for result in results])
+    return {"assets": assets, "screens": [{**result, "preview": preview} for result, preview in zip(results, previews)]}
\ No newline at end of file
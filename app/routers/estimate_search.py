@@ -0,0 +1,39 @@
+import os
+import secrets
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from sqlalchemy.orm import Session
+from app.database import get_db
+from app.schemas.estimate import EstimateDetail, EstimatePage
+from app.models.estimate import SEARCHABLE_COLUMNS
+from app.services.estimate_search import MAX_PAGE_SIZE, get_estimate, search_estimates
+
+# 問い合わせ（個人情報）を返すため、APIキーが設定されていない場合は無効にする
+ESTIMATE_API_KEY = os.getenv("ESTIMATE_API_KEY")
+
+def require_api_key(x_api_key: Optional[str] = Header(None)):
+    if not ESTIMATE_API_KEY:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if x_api_key is None or not secrets.compare_digest(x_api_key, ESTIMATE_API_KEY):
+        raise HTTPException(status_code=401, detail="Invalid API key")
+
+router = APIRouter(dependencies=[Depends(require_api_key)])
+
+@router.get("/estimates", response_model=EstimatePage)
+async def list_estimates(
+    q: Optional[str] = Query(None, min_length=2, max_length=200),
+    email: Optional[str] = None,
+    cursor: Optional[int] = None,
+    limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+    db: Session = Depends(get_db),
+):
+    # 次のページは前のレスポンスの next_cursor を cursor に指定して取得する
+    items, next_cursor = await search_estimates(db, q=q, email=email, cursor=cursor, limit=limit)
+    return {"items": items, "next_cursor": next_cursor, "search_fields": list(SEARCHABLE_COLUMNS)}
+
+@router.get("/estimates/{estimate_id}", response_model=EstimateDetail)
+async def read_estimate(estimate_id: int, db: Session = Depends(get_db)):
+    estimate = await get_estimate(db, estimate_id)
+    if estimate is None:
+        raise HTTPException(status_code=404, detail="Estimate not found")
+    return estimate
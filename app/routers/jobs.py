@@ -0,0 +1,52 @@
+import asyncio
+import json
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+from app.schemas.estimate import EstimateBatchRequest, EstimateRequest, PreviewRequest
+from app.services.estimate import job_manager
+from app.services.jobs import SUCCEEDED, FAILED, public_job
+
+router = APIRouter()
+
+@router.post("/jobs/estimate", status_code=202)
+async def submit_estimate_job(request: EstimateRequest):
+    return public_job(await job_manager.submit("estimate", request.answers))
+
+@router.post("/jobs/estimate/batch", status_code=202)
+async def submit_estimate_batch_job(request: EstimateBatchRequest):
+    # 複数の回答をまとめて見積もる（同時実行数は BATCH_CONCURRENCY）
+    return public_job(await job_manager.submit("estimate_batch", request.model_dump()))
+
+@router.post("/jobs/preview", status_code=202)
+async def submit_preview_job(request: PreviewRequest):
+    return public_job(await job_manager.submit("preview", request.answers))
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = await job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return public_job(job)
+
+@router.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, poll_interval: float = 0.5):
+    if await job_manager.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    # 状態が変わるたびに status イベントを送り、完了したら result イベントで結果を返す
+    async def body():
+        last_status = None
+        while True:
+            job = await job_manager.get(job_id)
+            if job is None:
+                yield f"event: error\ndata: {json.dumps({'detail': 'Job expired'})}\n\n"
+                return
+            if job["status"] != last_status:
+                last_status = job["status"]
+                yield f"event: status\ndata: {json.dumps({'status': last_status})}\n\n"
+            if job["status"] in (SUCCEEDED, FAILED):
+                yield f"event: result\ndata: {json.dumps(public_job(job), ensure_ascii=False)}\n\n"
+                return
+            await asyncio.sleep(max(poll_interval, 0.1))
+
+    return StreamingResponse(body(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
@@ -0,0 +1,25 @@
+import os
+import secrets
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import PlainTextResponse
+from app.services.metrics import render_metrics
+
+# 内部の状態（呼び出し数やエラー数）を返すため、キーが設定されていない場合は無効にする
+METRICS_API_KEY = os.getenv("METRICS_API_KEY")
+
+def require_metrics_key(x_api_key: Optional[str] = Header(None), authorization: Optional[str] = Header(None)):
+    if not METRICS_API_KEY:
+        raise HTTPException(status_code=404, detail="Not Found")
+    # Prometheus の bearer_token 設定でも送れるよう、Authorization: Bearer も受け付ける
+    if x_api_key is None and authorization and authorization.startswith("Bearer "):
+        x_api_key = authorization[len("Bearer "):]
+    if x_api_key is None or not secrets.compare_digest(x_api_key, METRICS_API_KEY):
+        raise HTTPException(status_code=401, detail="Invalid API key")
+
+router = APIRouter(dependencies=[Depends(require_metrics_key)])
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    # Prometheus のテキスト形式で返す
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,24 @@
+from fastapi import APIRouter, HTTPException, Path, Request
+from fastapi.responses import HTMLResponse, Response
+from app.services.html_preview import PREVIEW_STORE_TTL, load_preview
+
+router = APIRouter()
+
+# 内容のハッシュがIDなので、同じIDのHTMLが変わることはない（保存期間を超えてはキャッシュさせない）
+PREVIEW_CACHE_CONTROL = f"private, max-age={int(PREVIEW_STORE_TTL)}, immutable"
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+@router.get("/previews/{preview_id}", response_class=HTMLResponse)
+async def get_preview(request: Request, preview_id: str = Path(..., pattern="^[0-9a-f]{32}$")):
+    etag = f'"{preview_id}"'
+    headers = {"ETag": etag, "Cache-Control": PREVIEW_CACHE_CONTROL}
+    # 内容は変わらないため、ブラウザが同じIDを持っていればキャッシュの有無を確認せずに 304 を返す
+    if _etag_matches(request.headers.get("if-none-match", ""), etag):
+        return Response(status_code=304, headers=headers)
+    html = await load_preview(preview_id)
+    if html is None:
+        raise HTTPException(status_code=404, detail="Preview not found")
+    return HTMLResponse(html, headers=headers)
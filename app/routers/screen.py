@@ -1,9 +1,27 @@
+import json
 from fastapi import APIRouter, HTTPException
-from app.schemas.screen import ScreenDetailsRequest
-from app.services.screen import get_screen_details
+from fastapi.responses import StreamingResponse
+from app.schemas.screen import ScreenDetailsRequest, ScreenDetailsBatchRequest
+from app.services.screen import get_screen_details, get_screen_details_batch, iter_screen_details
+from app.services.screen_prefetch import screen_prefetcher
 
 router = APIRouter()
 
 @router.post("/screen_details")
 async def screen_details(request: ScreenDetailsRequest):
-    return await get_screen_details(request.screen, request.answers)
\ No newline at end of file
+    # 先読み中のセッションが使われていることを記録する（途絶えると先読みを取り消す）
+    screen_prefetcher.touch(request.answers)
+    return await get_screen_details(request.screen, request.answers)
+
+@router.post("/screen_details/batch")
+async def screen_details_batch(request: ScreenDetailsBatchRequest):
+    screen_prefetcher.touch(request.answers)
+    if not request.stream:
+        return await get_screen_details_batch(request.screens, request.answers)
+
+    # 完了した画面ごとにNDJSONで1行ずつ返す
+    async def body():
+        async for entry in iter_screen_details(request.screens, request.answers):
+            yield json.dumps(entry, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(body(), media_type="application/x-ndjson")
\ No newline at end of file
@@ -1,13 +1,22 @@
-from pydantic import BaseModel
-from typing import List, Optional, Dict, Union, Any
+from pydantic import BaseModel, ConfigDict, Field
+from typing import List, Literal, Optional, Dict, Union, Any
+from datetime import datetime
 
-class SimulationResult(BaseModel):
+class EstimateSections(BaseModel):
     requirements_specification: str
     requirements_definition: str
     screens: List[str]
     estimate_develop: str
+
+class SimulationResult(EstimateSections):
     answers: Dict[str, Optional[Union[str, List[str]]]]
 
+class CombinedEstimate(EstimateSections):
+    # 統合モードで1回のLLM呼び出しが返すJSON
+    model_config = ConfigDict(extra="forbid")
+
+    analysis: str
+
 class InquiryRequest(BaseModel):
     name: str
     email: str
@@ -16,9 +25,42 @@ class InquiryRequest(BaseModel):
 
 class EstimateRequest(BaseModel):
     answers: Dict[str, Any]
+    # 保存済みフォームのID。指定すると前回の結果から参照する回答が変わったセクションだけを再生成する
+    form_id: Optional[str] = Field(None, max_length=36)
+
+class EstimateBatchItem(BaseModel):
+    id: Optional[str] = None
+    answers: Dict[str, Any]
+
+class EstimateBatchRequest(BaseModel):
+    # 1ジョブが長時間ワーカーを占有しないよう件数を制限する（それ以上は app.cli.batch_estimate を使う）
+    items: List[EstimateBatchItem] = Field(..., min_length=1, max_length=200)
+    mode: Optional[Literal["fanout", "combined"]] = None
 
 
 class PreviewRequest(BaseModel):
     answers: Dict[str, Any]
 
+class EstimateSummary(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    name: Optional[str] = None
+    email: Optional[str] = None
+    screens: Optional[List[str]] = None
+    created_at: Optional[datetime] = None
+
+class EstimateDetail(EstimateSummary):
+    inquiry: Optional[str] = None
+    requirements_specification: Optional[str] = None
+    requirements_definition: Optional[str] = None
+    estimate_develop: Optional[str] = None
+    answers: Optional[Dict[str, Any]] = None
+
+class EstimatePage(BaseModel):
+    items: List[EstimateSummary]
+    next_cursor: Optional[int] = None
+    # q で検索したカラム（生成ドキュメントを圧縮して保存している場合は inquiry のみ）
+    search_fields: List[str]
+
 # 他のスキーマ定義...
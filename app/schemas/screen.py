@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import Dict, Any
+from pydantic import BaseModel, Field
+from typing import Dict, Any, List
 
 class ScreenData(BaseModel):
     # 画面詳細データのフィールドを定義
@@ -7,4 +7,14 @@ class ScreenData(BaseModel):
 
 class ScreenDetailsRequest(BaseModel):
     screen: str
-    answers: Dict[str, Any]
\ No newline at end of file
+    answers: Dict[str, Any]
+
+class ScreenDetailsBatchRequest(BaseModel):
+    # 1画面につき3回LLMを呼び出すため、画面一覧の上限（10画面）に合わせて制限する
+    screens: List[str] = Field(..., max_length=10)
+    answers: Dict[str, Any]
+    stream: bool = False
+
+class ScreenList(BaseModel):
+    # 画面一覧を生成するLLM呼び出しが返すJSON
+    screens: List[str]
@@ -1,30 +1,54 @@
-from textblob import TextBlob
-import re
-from openai import AsyncOpenAI
+import asyncio
 import os
+import re
+import unicodedata
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from app.services.llm import create_chat_completion
+from app.services.prompt_budget import build_budgeted_prompt
+
+# 形態素解析器を使わずに日本語を扱うため、漢字・カタカナ・英数字の連続をそれぞれ1語とみなす
+# （ひらがなは助詞・活用語尾がほとんどなので区切りとして扱う）
+TOKEN_PATTERN = re.compile(r"[一-龯々〆ヵヶ]+|[ァ-ヺー]+|[a-z0-9][a-z0-9_\-]*")
+# 感情分析の辞書は英語（と顔文字）のみなので、ASCII文字を含まない文は解析不要
+ASCII_PATTERN = re.compile(r"[!-~]")
+STOPWORDS = frozenset(["and", "the", "to", "of", "in", "is", "it", "for", "we", "be", "are", "on", "with", "or", "an"])
 
-aclient = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "2"))
+_executor = None
 
 async def analyze_with_gpt(answers):
-    prompt = "以下のプロジェクト評価フォームの回答を分析し、プロジェクトの強みと弱み、改善点を指摘してください:\n\n"
-    for key, answer in answers.items():
-        prompt += f"質問{key}: {answer}\n\n"
-
-    response = await aclient.chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=[
-            {"role": "system", "content": "あなたはプロジェクト評価の専門家です。"},
-            {"role": "user", "content": prompt}
-        ]
+    system_prompt = "あなたはプロジェクト評価の専門家です。"
+    prompt = build_budgeted_prompt(
+        "analyze_with_gpt",
+        "gpt-3.5-turbo",
+        system_prompt,
+        lambda text: f"以下のプロジェクト評価フォームの回答（質問番号: 回答）を分析し、プロジェクトの強みと弱み、改善点を指摘してください:\n\n{text}\n",
+        answers,
+    )
+
+    return await create_chat_completion(
+        "gpt-3.5-turbo",
+        system_prompt,
+        prompt,
+        name="analyze_with_gpt",
     )
 
-    return response.choices[0].message.content.strip()
+@lru_cache(maxsize=1)
+def _get_sentiment_analyzer():
+    # textblob/nltk の読み込みは重いため、初回利用時に一度だけ行う
+    from textblob.en.sentiments import PatternAnalyzer
+    return PatternAnalyzer()
 
+@lru_cache(maxsize=4096)
 def analyze_sentiment(text: str):
-    blob = TextBlob(text)
-    return blob.sentiment.polarity
+    # 同じ回答での再見積もりが多いため、結果を文単位でキャッシュする
+    if not ASCII_PATTERN.search(text):
+        return 0.0
+    return _get_sentiment_analyzer().analyze(text).polarity
 
-def extract_keywords(answers):
+def _answer_texts(answers):
     texts = []
     for answer in answers.values():
         if isinstance(answer, str):
@@ -33,11 +57,29 @@ def extract_keywords(answers):
             texts.extend([str(a) for a in answer])
         else:
             texts.append(str(answer))
-    text = ' '.join(texts)
-    words = re.findall(r'\w+', text.lower())
-    word_freq = {}
-    for word in words:
-        if len(word) > 1:
-            word_freq[word] = word_freq.get(word, 0) + 1
-    sorted_words = sorted(word_freq.items(), key=lambda x: x[1], reverse=True)
-    return [word for word, _ in sorted_words[:10]]
\ No newline at end of file
+    return texts
+
+def tokenize(text: str):
+    # 全角英数字などを正規化してから分割する
+    return TOKEN_PATTERN.findall(unicodedata.normalize("NFKC", text).lower())
+
+def extract_keywords(answers, top_k: int = 10):
+    counter = Counter()
+    for text in _answer_texts(answers):
+        counter.update(word for word in tokenize(text) if len(word) > 1 and word not in STOPWORDS)
+    return [word for word, _ in counter.most_common(top_k)]
+
+def analyze_answers(answers):
+    # 全回答の感情スコアとキーワードをまとめて求める
+    sentiment_scores = [analyze_sentiment(answer) for answer in answers.values() if isinstance(answer, str)]
+    return sentiment_scores, extract_keywords(answers)
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=ANALYSIS_WORKERS, thread_name_prefix="analysis")
+    return _executor
+
+async def analyze_answers_async(answers):
+    # CPU処理はイベントループ外のスレッドで実行する
+    return await asyncio.get_running_loop().run_in_executor(_get_executor(), analyze_answers, answers)
@@ -0,0 +1,258 @@
+import asyncio
+import json
+import logging
+import os
+from typing import Optional
+
+from sqlalchemy import insert, select, update
+
+from app.database import SessionLocal, run_db
+from app.models.estimate import Estimate
+from app.services.estimate import ESTIMATE_SECTIONS, generate_estimate, section_answers
+from app.services.llm import PRIORITY_BACKGROUND, BatchRequestPending, OfflineBatch, llm_priority, offline_batch
+
+logger = logging.getLogger(__name__)
+
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+# DB・ファイルへの書き込みとチェックポイントの更新をまとめる件数
+BATCH_FLUSH_SIZE = int(os.getenv("BATCH_FLUSH_SIZE", "50"))
+
+
+async def iter_jsonl_items(path: str):
+    """1行1件の {"id": ..., "answers": {...}} を読み込む（id が無ければ行番号を使う）"""
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            yield {**record, "id": str(record.get("id", line_number))}
+
+
+def _fetch_estimate_rows(after_id: int, limit: int):
+    with SessionLocal() as db:
+        query = (
+            select(Estimate.id, Estimate.answers)
+            .where(Estimate.id > after_id, Estimate.answers.is_not(None))
+            .order_by(Estimate.id)
+            .limit(limit)
+        )
+        return db.execute(query).all()
+
+
+async def iter_estimate_items(page_size: int = 500):
+    """estimate_data の保存済みの回答を id 順に少しずつ読み込む"""
+    after_id = 0
+    while True:
+        rows = await run_db(_fetch_estimate_rows, after_id, page_size)
+        for row in rows:
+            yield {"id": str(row.id), "estimate_id": row.id, "answers": row.answers}
+        if len(rows) < page_size:
+            return
+        after_id = rows[-1].id
+
+
+async def iter_list_items(items):
+    for index, item in enumerate(items):
+        yield {**item, "id": str(item["id"] if item.get("id") is not None else index)}
+
+
+class JsonlSink:
+    def __init__(self, path: str):
+        self.path = path
+
+    async def write(self, records):
+        def _write():
+            with open(self.path, "a", encoding="utf-8") as f:
+                for record in records:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        await asyncio.to_thread(_write)
+
+
+class ListSink:
+    def __init__(self):
+        self.records = []
+
+    async def write(self, records):
+        self.records.extend(records)
+
+
+def _result_columns(result: dict) -> dict:
+    return {
+        "requirements_specification": result["requirements_specification"],
+        "requirements_definition": result["requirements_definition"],
+        "screens": result["screens"],
+        "estimate_develop": result["estimate_develop"],
+        "analysis": result["analysis"],
+    }
+
+
+class DatabaseSink:
+    """estimate_data の行は一括UPDATE、JSONLなどから来た新しい回答は一括INSERTで書き込む"""
+
+    def _write(self, records):
+        updates = [
+            {"id": record["estimate_id"], **_result_columns(record["result"])}
+            for record in records if record.get("estimate_id") is not None
+        ]
+        inserts = [
+            {
+                "name": record.get("name"),
+                "email": record.get("email"),
+                "inquiry": record.get("inquiry"),
+                "answers": record["answers"],
+                **_result_columns(record["result"]),
+            }
+            for record in records if record.get("estimate_id") is None
+        ]
+        with SessionLocal() as db:
+            if updates:
+                db.execute(update(Estimate), updates)
+            if inserts:
+                db.execute(insert(Estimate), inserts)
+            db.commit()
+
+    async def write(self, records):
+        await run_db(self._write, records)
+
+
+class Checkpoint:
+    """書き込みが完了した項目のIDを1行ずつ追記し、再開時にはそれらを飛ばす"""
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self.done = set()
+        if path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.done = {line.strip() for line in f if line.strip()}
+
+    async def mark(self, item_ids):
+        self.done.update(item_ids)
+        if not self.path:
+            return
+
+        def _append():
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.writelines(f"{item_id}\n" for item_id in item_ids)
+        await asyncio.to_thread(_append)
+
+
+async def run_batch(items, sink, checkpoint: Checkpoint = None, concurrency: int = BATCH_CONCURRENCY,
+                    mode: str = None, responses: dict = None, flush_size: int = BATCH_FLUSH_SIZE):
+    """items の各回答で generate_estimate を実行し、flush_size 件ごとに sink に書き込む
+
+    responses（Batch APIの結果。キーは custom_id）を渡すと、LLMを呼び出さずにその結果を使う。
+    """
+    checkpoint = checkpoint or Checkpoint(None)
+    queue = asyncio.Queue(maxsize=concurrency * 2)
+    pending = []
+    flush_lock = asyncio.Lock()
+    stats = {"succeeded": 0, "failed": 0, "skipped": 0}
+
+    async def flush():
+        async with flush_lock:
+            if not pending:
+                return
+            records = pending[:]
+            del pending[:]
+            await sink.write(records)
+            # 書き込みが終わってから記録するので、途中で止まっても結果を失わない
+            await checkpoint.mark([record["id"] for record in records])
+
+    async def estimate(item):
+        if responses is None:
+            return await generate_estimate(item["answers"], mode=mode)
+        with offline_batch(OfflineBatch(responses)):
+            return await generate_estimate(item["answers"], mode=mode)
+
+    async def worker():
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            try:
+                result = await estimate(item)
+            except BatchRequestPending:
+                logger.warning("Batch item %s has requests without results; run it again", item["id"])
+                stats["failed"] += 1
+                continue
+            except Exception:
+                logger.exception("Batch item %s failed", item["id"])
+                stats["failed"] += 1
+                continue
+            pending.append({**item, "result": result})
+            stats["succeeded"] += 1
+            if len(pending) >= flush_size:
+                await flush()
+
+    async def produce():
+        async for item in items:
+            if item["id"] in checkpoint.done:
+                stats["skipped"] += 1
+                continue
+            await queue.put(item)
+        for _ in range(concurrency):
+            await queue.put(None)
+
+    # 一括処理は対話的なリクエストより後に回す
+    with llm_priority(PRIORITY_BACKGROUND):
+        workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+        tasks = [asyncio.create_task(produce()), *workers]
+        try:
+            # 書き込みの失敗などでワーカーが止まったら、キューへの投入を待ち続けずに全体を失敗させる
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await flush()
+    return stats
+
+
+async def generate_estimate_batch(payload):
+    # /jobs/estimate/batch から投入されるジョブ
+    sink = ListSink()
+    stats = await run_batch(iter_list_items(payload["items"]), sink, mode=payload.get("mode"))
+    return {"results": [{"id": record["id"], **record["result"]} for record in sink.records], **stats}
+
+
+async def export_batch_requests(items, path: str, checkpoint: Checkpoint = None) -> int:
+    """各セクションのリクエストを Batch API の入力形式（JSONL）で書き出す。同じリクエストは1つにまとめる"""
+    checkpoint = checkpoint or Checkpoint(None)
+    batch = OfflineBatch()
+    with offline_batch(batch):
+        async for item in items:
+            if item["id"] in checkpoint.done:
+                continue
+            for section, func in ESTIMATE_SECTIONS.items():
+                try:
+                    await func(section_answers(section, item["answers"]))
+                except BatchRequestPending:
+                    pass
+
+    def _write():
+        with open(path, "w", encoding="utf-8") as f:
+            for key, body in batch.requests.items():
+                line = {"custom_id": key, "method": "POST", "url": "/v1/chat/completions", "body": body}
+                f.write(json.dumps(line, ensure_ascii=False) + "\n")
+    await asyncio.to_thread(_write)
+    return len(batch.requests)
+
+
+def load_batch_responses(path: str) -> dict:
+    """Batch API の出力（JSONL）を custom_id -> 応答本文 の辞書にする。失敗したリクエストは含めない"""
+    responses = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            response = record.get("response") or {}
+            if record.get("error") or response.get("status_code") != 200:
+                logger.warning("Batch request %s failed: %s", record.get("custom_id"), record.get("error"))
+                continue
+            content = response["body"]["choices"][0]["message"].get("content")
+            if content is None:
+                logger.warning("Batch request %s returned no content (refusal)", record.get("custom_id"))
+                continue
+            responses[record["custom_id"]] = content.strip()
+    return responses
@@ -0,0 +1,126 @@
+import base64
+import glob
+import os
+import threading
+import zlib
+from typing import Optional
+
+# 生成ドキュメントの保存形式: "none"（そのまま）, "zlib", "zstd"（zstandard が必要。無ければ起動時にエラーにする）
+ESTIMATE_COMPRESSION = os.getenv("ESTIMATE_COMPRESSION", "none").lower()
+# zstd の辞書ファイル（カンマ区切り）。先頭の辞書で圧縮し、読み込み時は全ての辞書を使える
+ESTIMATE_ZSTD_DICTIONARY = os.getenv("ESTIMATE_ZSTD_DICTIONARY", "")
+ESTIMATE_ZSTD_LEVEL = int(os.getenv("ESTIMATE_ZSTD_LEVEL", "9"))
+
+# 圧縮した値はテキストカラムにそのまま入るよう、目印の後にBase64で格納する
+# （目印の無い値は従来どおりの平文として扱うため、既存の行も混在したまま読める）
+ZLIB_PREFIX = "\x1fz:"
+ZSTD_PREFIX = "\x1fs:"
+
+
+def _import_zstd():
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+
+def template_samples(template_dir: str):
+    # テンプレートを見出し単位に分け、辞書の学習用サンプルにする
+    samples = []
+    for path in sorted(glob.glob(os.path.join(template_dir, "*.md"))):
+        with open(path, "r", encoding="utf-8") as f:
+            section = []
+            for line in f:
+                if line.startswith("#") and section:
+                    samples.append("".join(section).encode("utf-8"))
+                    section = []
+                section.append(line)
+            if section:
+                samples.append("".join(section).encode("utf-8"))
+    return samples
+
+
+def train_dictionary(samples, size: int = 32 * 1024) -> bytes:
+    zstd = _import_zstd()
+    if zstd is None:
+        raise RuntimeError("zstandard is required to train a compression dictionary")
+    return zstd.train_dictionary(size, samples).as_bytes()
+
+
+class DocumentCodec:
+    """生成ドキュメントを圧縮してテキストとして保存し、読み込み時に展開する"""
+
+    def __init__(self, mode: str = "none", dictionaries=(), level: int = ESTIMATE_ZSTD_LEVEL):
+        if mode not in ("none", "zlib", "zstd"):
+            raise ValueError(f"Unknown ESTIMATE_COMPRESSION: {mode}")
+        if mode == "zstd" and _import_zstd() is None:
+            # zlib で書き続けると辞書を使えず、zstd で保存済みの行も読めないため起動させない
+            raise RuntimeError("ESTIMATE_COMPRESSION=zstd requires the zstandard package")
+        self.mode = mode
+        self.level = level
+        self.dictionaries = list(dictionaries)
+        self._zstd_dicts = None
+        # zstd の圧縮・展開オブジェクトはスレッド間で共有できないため、スレッドごとに作る
+        self._local = threading.local()
+
+    def _get_zstd_dicts(self):
+        # zstandard は zstd の値を扱うときに初めて読み込む
+        if self._zstd_dicts is None:
+            zstd = _import_zstd()
+            if zstd is None:
+                raise RuntimeError("zstandard is required to read zstd-compressed documents")
+            dicts = [zstd.ZstdCompressionDict(data) for data in self.dictionaries]
+            self._zstd_dicts = (zstd, dicts[0] if dicts else None, {d.dict_id(): d for d in dicts})
+        return self._zstd_dicts
+
+    def _compressor(self):
+        compressor = getattr(self._local, "compressor", None)
+        if compressor is None:
+            zstd, compress_dict, _ = self._get_zstd_dicts()
+            compressor = self._local.compressor = zstd.ZstdCompressor(level=self.level, dict_data=compress_dict)
+        return compressor
+
+    def _decompressor(self, dict_id: int):
+        decompressors = getattr(self._local, "decompressors", None)
+        if decompressors is None:
+            decompressors = self._local.decompressors = {}
+        if dict_id not in decompressors:
+            zstd, _, dicts = self._get_zstd_dicts()
+            if dict_id and dict_id not in dicts:
+                raise RuntimeError(f"zstd dictionary {dict_id} is not configured in ESTIMATE_ZSTD_DICTIONARY")
+            decompressors[dict_id] = zstd.ZstdDecompressor(dict_data=dicts.get(dict_id))
+        return decompressors[dict_id]
+
+    def encode(self, value: Optional[str]) -> Optional[str]:
+        if value is None or self.mode == "none":
+            return value
+        data = value.encode("utf-8")
+        if self.mode == "zlib":
+            return ZLIB_PREFIX + base64.b64encode(zlib.compress(data, 6)).decode("ascii")
+        return ZSTD_PREFIX + base64.b64encode(self._compressor().compress(data)).decode("ascii")
+
+    def decode(self, value: Optional[str]) -> Optional[str]:
+        if value is None or not value.startswith("\x1f"):
+            return value
+        if value.startswith(ZLIB_PREFIX):
+            return zlib.decompress(base64.b64decode(value[len(ZLIB_PREFIX):])).decode("utf-8")
+        if value.startswith(ZSTD_PREFIX):
+            data = base64.b64decode(value[len(ZSTD_PREFIX):])
+            zstd, _, _ = self._get_zstd_dicts()
+            dict_id = zstd.get_frame_parameters(data).dict_id
+            return self._decompressor(dict_id).decompress(data).decode("utf-8")
+        return value
+
+
+def _load_dictionaries(paths: str):
+    dictionaries = []
+    for path in paths.split(","):
+        if path.strip():
+            with open(path.strip(), "rb") as f:
+                dictionaries.append(f.read())
+    return dictionaries
+
+
+# Estimate の長文カラムで共有する
+document_codec = DocumentCodec(ESTIMATE_COMPRESSION, _load_dictionaries(ESTIMATE_ZSTD_DICTIONARY))
@@ -1,35 +1,35 @@
 import asyncio
-from app.services.analysis import analyze_with_gpt, analyze_sentiment, extract_keywords
-from app.services.requirements import create_system_requirements_specification, create_requirements_definition
+from app.services.analysis import analyze_with_gpt, analyze_answers_async
+from app.services.requirements import (
+    create_system_requirements_specification,
+    create_requirements_definition,
+    stream_system_requirements_specification,
+    stream_requirements_definition,
+)
+from app.services.html_preview import store_preview
 from app.services.preview import generate_title, generate_catchphrase, generate_description, generate_preview_screen
 from app.services.screen import create_screen_list, estimate_total_workload, preview_screen_list
-from app.schemas.estimate import InquiryRequest
-from app.database import get_db
+from app.services.screen_prefetch import screen_prefetcher
+from app.schemas.estimate import CombinedEstimate, InquiryRequest
+from app.services.llm import LLMRefusal, create_chat_completion, json_response_format
+from app.services.estimate_runs import load_previous_sections, store_sections
+from app.services.form_store import form_store
+from app.services.prompt_budget import build_budgeted_prompt, serialize_answers
+from app.services.templates import template_registry
+from pydantic import ValidationError
+from app.database import run_db
+from app.services.jobs import JobManager, create_job_store
 from app.models.estimate import Estimate
-import json
 from sqlalchemy.orm import Session
-from openai import AsyncOpenAI
+import hashlib
+import json
 import os
 import logging
 
-aclient = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-async def generate_estimate(answers):
-    tasks = [
-        create_system_requirements_specification(answers),
-        create_requirements_definition(answers),
-        create_screen_list(answers),
-        estimate_total_workload(answers),
-        analyze_with_gpt(answers),
-    ]
-    results = await asyncio.gather(*tasks)
+logger = logging.getLogger(__name__)
 
-    requirements_specification, requirements_definition, screens, estimate_develop, gpt_analysis = results
-
-    sentiment_scores = [analyze_sentiment(str(answer)) for answer in answers.values() if isinstance(answer, str)]
-    keywords = extract_keywords(answers)
-
-    combined_analysis = f"""
+def build_combined_analysis(gpt_analysis, sentiment_scores, keywords):
+    return f"""
 GPTによる分析:
 {gpt_analysis}
 
@@ -40,27 +40,207 @@ GPTによる分析:
 {', '.join(keywords)}
 """
 
+# "fanout": セクションごとに5回LLMを呼び出す / "combined": 1回の構造化出力で全セクションを生成する
+ESTIMATE_MODES = ("fanout", "combined")
+ESTIMATE_MODE = os.getenv("ESTIMATE_MODE", "fanout")
+# JSONスキーマによる構造化出力に対応したモデルを推奨（非対応のモデルではJSONモードになる）
+ESTIMATE_COMBINED_MODEL = os.getenv("ESTIMATE_COMBINED_MODEL", "gpt-4o-mini")
+# 統合モードのプロンプトのトークン数の上限（0 は上限なし）。2つのテンプレートを含むため、指定する場合は通常より大きくする
+ESTIMATE_COMBINED_TOKEN_BUDGET = int(os.getenv("ESTIMATE_COMBINED_TOKEN_BUDGET", "0"))
+
+COMBINED_ESTIMATE_ROLE = "あなたはシステム開発の要件定義と見積もりの専門家です。指定されたJSON形式のみで簡潔に回答してください。"
+
+COMBINED_ESTIMATE_SCHEMA = CombinedEstimate.model_json_schema()
+
+def _combined_estimate_prompt(text):
+    return f"""
+以下のプロジェクト要件に基づいて、次の項目をJSONで返してください。
+- requirements_specification: システム要求仕様書の概要。テンプレート1の構成に沿って主要なポイントのみを簡潔に記述する
+- requirements_definition: 要件定義書の概要。テンプレート2の構成に沿って主要なポイントのみを簡潔に記述する
+- screens: 想定される主要な画面名の配列（最大10個、画面名のみ）
+- estimate_develop: 各フェーズ（要件定義、設計、開発、テスト）の大まかな工数と合計（人日）
+- analysis: プロジェクトの強みと弱み、改善点
+
+プロジェクト要件:
+{text}
+
+テンプレート1:
+{template_registry.get("System_Requirements_Specification")}
+
+テンプレート2:
+{template_registry.get("Requirements_Definition")}
+"""
+
+async def generate_combined_sections(answers) -> CombinedEstimate:
+    prompt = build_budgeted_prompt(
+        "generate_estimate_combined",
+        ESTIMATE_COMBINED_MODEL,
+        COMBINED_ESTIMATE_ROLE,
+        _combined_estimate_prompt,
+        answers,
+        budget=ESTIMATE_COMBINED_TOKEN_BUDGET,
+    )
+    content = await create_chat_completion(
+        ESTIMATE_COMBINED_MODEL,
+        COMBINED_ESTIMATE_ROLE,
+        prompt,
+        name="generate_estimate_combined",
+        response_format=json_response_format(ESTIMATE_COMBINED_MODEL, "estimate", COMBINED_ESTIMATE_SCHEMA),
+        validate=CombinedEstimate.model_validate_json,
+    )
+    sections = CombinedEstimate.model_validate_json(content)
+    sections.screens = [screen.strip("- ").strip() for screen in sections.screens if screen.strip("- ").strip()]
+    return sections
+
+async def _generate_estimate_combined(answers):
+    try:
+        sections, (sentiment_scores, keywords) = await asyncio.gather(
+            generate_combined_sections(answers),
+            analyze_answers_async(answers),
+        )
+    except (ValidationError, LLMRefusal) as e:
+        # スキーマに合わない応答や拒否だった場合は従来の個別呼び出しで生成し直す
+        logger.warning("Combined estimate response was invalid, falling back to fan-out: %s", e)
+        return await _generate_estimate_fanout(answers)
+
     return {
-        "requirements_specification": requirements_specification,
-        "requirements_definition": requirements_definition,
-        "screens": screens,
-        "estimate_develop": estimate_develop,
-        "analysis": combined_analysis
+        "requirements_specification": sections.requirements_specification,
+        "requirements_definition": sections.requirements_definition,
+        "screens": sections.screens,
+        "estimate_develop": sections.estimate_develop,
+        "analysis": build_combined_analysis(sections.analysis, sentiment_scores, keywords)
     }
 
-async def save_inquiry_data(request: InquiryRequest):
-    new_estimate = Estimate(
-        name=request.name,
-        email=request.email,
-        inquiry=request.message,
-        requirements_specification=request.simulationResult.requirements_specification,
-        requirements_definition=request.simulationResult.requirements_definition,
-        screens=json.dumps(request.simulationResult.screens),
-        estimate_develop=request.simulationResult.estimate_develop,
-        analysis=json.dumps(request.simulationResult.answers)
+async def generate_estimate(answers, mode: str = None, form_id: str = None, prefetch_screens: bool = False):
+    mode = mode or ESTIMATE_MODE
+    if mode not in ESTIMATE_MODES:
+        raise ValueError(f"Unknown estimate mode: {mode}")
+    if form_id and await form_store.get(form_id) is None:
+        # 保存されていないフォームのIDでは前回の結果を使わない
+        logger.warning("Unknown form_id %s; regenerating every section", form_id)
+        form_id = None
+    if mode == "combined":
+        result = await _generate_estimate_combined(answers)
+    else:
+        result = await _generate_estimate_fanout(answers, form_id)
+    if prefetch_screens:
+        # 続けて開かれることの多い画面詳細を、応答を返した後にバックグラウンドで生成しておく
+        screen_prefetcher.start(answers, result["screens"])
+    return result
+
+# fan-out モードで個別に生成するセクション
+ESTIMATE_SECTIONS = {
+    "requirements_specification": create_system_requirements_specification,
+    "requirements_definition": create_requirements_definition,
+    "screens": create_screen_list,
+    "estimate_develop": estimate_total_workload,
+    "analysis": analyze_with_gpt,
+}
+
+# 各セクションが参照する回答の質問番号（None は全ての回答を参照する）
+# 1: システムの目的・概要, 2: 利用者・規模, 3: 必要な機能, 4: 連携する既存システム, 5: 予算・スケジュール
+DEFAULT_SECTION_DEPENDENCIES = {
+    "requirements_specification": None,
+    "requirements_definition": None,
+    "screens": frozenset({"1", "3"}),
+    "estimate_develop": frozenset({"1", "2", "3", "4"}),
+    "analysis": None,
+}
+
+def _parse_section_dependencies(value: str):
+    # 例: "screens=1,3,5;estimate_develop=*"（"*" は全ての回答。指定のないセクションは既定の対応のまま）
+    dependencies = dict(DEFAULT_SECTION_DEPENDENCIES)
+    for item in value.split(";"):
+        if "=" in item:
+            section, keys = item.split("=", 1)
+            keys = keys.strip()
+            dependencies[section.strip()] = None if keys == "*" else frozenset(key.strip() for key in keys.split(",") if key.strip())
+    return dependencies
+
+ESTIMATE_SECTION_DEPENDENCIES = _parse_section_dependencies(os.getenv("ESTIMATE_SECTION_DEPENDENCIES", ""))
+
+def section_answers(section, answers):
+    # セクションの生成に使う回答だけを渡す
+    keys = ESTIMATE_SECTION_DEPENDENCIES.get(section)
+    if keys is None:
+        return answers
+    return {key: value for key, value in answers.items() if str(key) in keys}
+
+def section_digest(section, answers):
+    # 正規化した回答から求めるため、空白だけの変更では再生成しない
+    payload = json.dumps(serialize_answers(section_answers(section, answers)), ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+async def _generate_estimate_fanout(answers, form_id=None):
+    # form_id があれば前回の実行と比べ、参照する回答が変わったセクションだけを再生成する
+    digests = {section: section_digest(section, answers) for section in ESTIMATE_SECTIONS}
+    reused = await load_previous_sections(form_id, digests) if form_id else {}
+    stale = [section for section in ESTIMATE_SECTIONS if section not in reused]
+
+    results = await asyncio.gather(
+        analyze_answers_async(answers),
+        *(ESTIMATE_SECTIONS[section](section_answers(section, answers)) for section in stale),
     )
-    
-    db: Session = next(get_db())
+    (sentiment_scores, keywords), generated = results[0], dict(zip(stale, results[1:]))
+    if form_id:
+        logger.info("Estimate for form %s: regenerated %s, reused %s", form_id, stale, list(reused))
+        await store_sections(form_id, digests, generated)
+
+    sections = {**reused, **generated}
+    return {
+        "requirements_specification": sections["requirements_specification"],
+        "requirements_definition": sections["requirements_definition"],
+        "screens": sections["screens"],
+        "estimate_develop": sections["estimate_develop"],
+        "analysis": build_combined_analysis(sections["analysis"], sentiment_scores, keywords)
+    }
+
+# トークン単位でストリーミングできる長文セクション
+STREAMABLE_SECTIONS = {
+    "requirements_specification": stream_system_requirements_specification,
+    "requirements_definition": stream_requirements_definition,
+}
+
+async def iter_estimate_events(answers, stream_tokens=False):
+    # 完了したセクションから順に (イベント名, データ) を返す
+    queue = asyncio.Queue()
+
+    async def run_section(section, coro_factory):
+        try:
+            if stream_tokens and section in STREAMABLE_SECTIONS:
+                chunks = []
+                async for delta in STREAMABLE_SECTIONS[section](section_answers(section, answers)):
+                    chunks.append(delta)
+                    await queue.put(("delta", {"section": section, "content": delta}))
+                content = "".join(chunks).strip()
+            else:
+                content = await coro_factory()
+            if section == "analysis":
+                sentiment_scores, keywords = await analyze_answers_async(answers)
+                content = build_combined_analysis(content, sentiment_scores, keywords)
+            await queue.put(("section", {"section": section, "content": content}))
+        except Exception as e:
+            logger.warning("Estimate section %s failed: %r", section, e)
+            await queue.put(("error", {"section": section, "detail": str(e)}))
+
+    tasks = [
+        asyncio.create_task(run_section(section, lambda func=func, section=section: func(section_answers(section, answers))))
+        for section, func in ESTIMATE_SECTIONS.items()
+    ]
+    try:
+        remaining = len(tasks)
+        while remaining:
+            event, data = await queue.get()
+            if event != "delta":
+                remaining -= 1
+            yield event, data
+        yield "done", {}
+    finally:
+        # クライアントが切断した場合は残りのLLM呼び出しを中断する
+        for task in tasks:
+            task.cancel()
+
+def _save_estimate(db: Session, new_estimate: Estimate):
     try:
         db.add(new_estimate)
         db.commit()
@@ -69,39 +249,78 @@ async def save_inquiry_data(request: InquiryRequest):
     except Exception as e:
         db.rollback()
         raise e
-    finally:
-        db.close()
+
+async def save_inquiry_data(request: InquiryRequest, db: Session):
+    new_estimate = Estimate(
+        name=request.name,
+        email=request.email,
+        inquiry=request.message,
+        requirements_specification=request.simulationResult.requirements_specification,
+        requirements_definition=request.simulationResult.requirements_definition,
+        screens=request.simulationResult.screens,
+        estimate_develop=request.simulationResult.estimate_develop,
+        answers=request.simulationResult.answers,
+    )
+
+    # commitはスレッドプールで実行し、LLM呼び出し中の他リクエストを止めない
+    return await run_db(_save_estimate, db, new_estimate)
+
+PREVIEW_CONCURRENCY = int(os.getenv("PREVIEW_CONCURRENCY", "12"))
+PREVIEW_CALL_TIMEOUT = float(os.getenv("PREVIEW_CALL_TIMEOUT", "60"))
+
+PREVIEW_FIELDS = {
+    "title": generate_title,
+    "catchphrase": generate_catchphrase,
+    "description": generate_description,
+    "preview": generate_preview_screen,
+}
+
+async def _run_preview_call(semaphore, func, screen):
+    async with semaphore:
+        return await asyncio.wait_for(func(screen), timeout=PREVIEW_CALL_TIMEOUT)
 
 async def generate_preview(answers):
 
     # まずはユーザーの回答から3つの主要画面を生成する
     screens = await preview_screen_list(answers)  # ここでawaitを追加
-    # 生成された画面のプレビューを生成する
-    results = []
-    for screen in screens:
-        title = await generate_title(screen)
-        catchphrase = await generate_catchphrase(screen)
-        description = await generate_description(screen)
-        preview = await generate_preview_screen(screen)
-        results.append({
-            "title": title,
-            "catchphrase": catchphrase,
-            "description": description,
-            "preview": preview
-        })
-    
-
-    # Configure logging
-    logging.basicConfig(level=logging.INFO)
-    logger = logging.getLogger(__name__)
-
-    # Log the results before returning
-    logger.info("Generated preview results:")
-    for i, result in enumerate(results):
-        logger.info(f"Screen {i + 1}:")
-        logger.info(f"  Title: {result['title']}")
-        logger.info(f"  Catchphrase: {result['catchphrase']}")
-        logger.info(f"  Description: {result['description']}")
-        logger.info(f"  Preview: {result['preview'][:100]}...")  # Log first 100 characters of preview
+    # 全画面・全項目のプレビュー生成を同時に実行する（同時実行数は PREVIEW_CONCURRENCY で制限）
+    semaphore = asyncio.Semaphore(PREVIEW_CONCURRENCY)
+    calls = [
+        (screen, field, _run_preview_call(semaphore, func, screen))
+        for screen in screens
+        for field, func in PREVIEW_FIELDS.items()
+    ]
+    outputs = await asyncio.gather(*(call for _, _, call in calls), return_exceptions=True)
+    if outputs and all(isinstance(output, BaseException) for output in outputs):
+        raise outputs[0]
+
+    # 一部の呼び出しが失敗しても、成功した項目は返す
+    results = [{field: None for field in PREVIEW_FIELDS} for _ in screens]
+    for index, ((screen, field, _), output) in enumerate(zip(calls, outputs)):
+        result = results[index // len(PREVIEW_FIELDS)]
+        if isinstance(output, BaseException):
+            logger.warning("Preview generation failed for %s (%s): %r", screen, field, output)
+            result.setdefault("errors", []).append(field)
+        else:
+            result[field] = output
+
+    # HTMLは内容のハッシュで保存し、GET /previews/{preview_id} からも取得できるようにする
+    previews = [result for result in results if result["preview"]]
+    ids = await asyncio.gather(*(store_preview(result["preview"]) for result in previews))
+    for result, preview_id in zip(previews, ids):
+        if preview_id is not None:
+            result["preview_id"] = preview_id
 
     return results  # Changed to return the entire results list
+
+async def _run_estimate_batch(payload):
+    # batch_estimate はこのモジュールを読み込むため、循環importを避けて実行時に読み込む
+    from app.services.batch_estimate import generate_estimate_batch
+    return await generate_estimate_batch(payload)
+
+# /jobs から投入される長時間処理のジョブ
+job_manager = JobManager(create_job_store(), {
+    "estimate": generate_estimate,
+    "estimate_batch": _run_estimate_batch,
+    "preview": generate_preview,
+})
@@ -0,0 +1,48 @@
+import asyncio
+import json
+import os
+
+from app.services.llm_cache import LLMCache, MemoryCache, SQLiteCache
+
+# form_id ごとの前回の見積もり結果の保存先。LLMのキャッシュとは別に持ち、LLM_CACHE_ENABLED の影響を受けない
+# （0件にすると保存しない。複数プロセスで共有するには SQLite のパスを指定する）
+ESTIMATE_RUN_STORE_MAX_ENTRIES = int(os.getenv("ESTIMATE_RUN_STORE_MAX_ENTRIES", "5000"))
+ESTIMATE_RUN_STORE_TTL = float(os.getenv("ESTIMATE_RUN_STORE_TTL", str(7 * 86400)))
+ESTIMATE_RUN_STORE_SQLITE_PATH = os.getenv("ESTIMATE_RUN_STORE_SQLITE_PATH")
+
+
+def _create_run_store() -> LLMCache:
+    disk = None
+    if ESTIMATE_RUN_STORE_SQLITE_PATH:
+        disk = SQLiteCache(ESTIMATE_RUN_STORE_SQLITE_PATH, max_entries=ESTIMATE_RUN_STORE_MAX_ENTRIES, ttl=ESTIMATE_RUN_STORE_TTL)
+    memory = MemoryCache(max_entries=ESTIMATE_RUN_STORE_MAX_ENTRIES, ttl=ESTIMATE_RUN_STORE_TTL)
+    return LLMCache(memory, disk, enabled=ESTIMATE_RUN_STORE_MAX_ENTRIES > 0)
+
+
+estimate_run_store = _create_run_store()
+
+
+def _section_key(form_id: str, section: str) -> str:
+    return f"{form_id}:{section}"
+
+
+async def load_previous_sections(form_id: str, digests):
+    """前回の実行から入力（digest）が変わっていないセクションの結果を返す"""
+    stored = await asyncio.gather(*(estimate_run_store.get(_section_key(form_id, section)) for section in digests))
+    reused = {}
+    for (section, digest), value in zip(digests.items(), stored):
+        if value is not None:
+            previous = json.loads(value)
+            if previous["digest"] == digest:
+                reused[section] = previous["content"]
+    return reused
+
+
+async def store_sections(form_id: str, digests, sections):
+    await asyncio.gather(*(
+        estimate_run_store.set(
+            _section_key(form_id, section),
+            json.dumps({"digest": digests[section], "content": content}, ensure_ascii=False),
+        )
+        for section, content in sections.items()
+    ))
@@ -0,0 +1,48 @@
+from typing import Optional
+
+from sqlalchemy import or_, select
+from sqlalchemy.orm import Session, load_only, undefer_group
+
+from app.database import run_db
+from app.models.estimate import SEARCHABLE_COLUMNS, Estimate
+
+MAX_PAGE_SIZE = 100
+
+# 一覧では長文カラムを読み込まない
+SUMMARY_COLUMNS = (Estimate.id, Estimate.name, Estimate.email, Estimate.screens, Estimate.created_at)
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _search_estimates(db: Session, q: Optional[str], email: Optional[str], cursor: Optional[int], limit: int):
+    # id の降順でのキーセットページネーション（OFFSETを使わないため、件数が増えてもページ取得のコストが変わらない）
+    query = select(Estimate).options(load_only(*SUMMARY_COLUMNS)).order_by(Estimate.id.desc())
+    if cursor is not None:
+        query = query.where(Estimate.id < cursor)
+    if email:
+        query = query.where(Estimate.email == email)
+    if q:
+        # PostgreSQLでは pg_trgm のGINインデックスが ILIKE '%...%' に使われる
+        pattern = f"%{_escape_like(q)}%"
+        query = query.where(or_(*(getattr(Estimate, column).ilike(pattern, escape="\\") for column in SEARCHABLE_COLUMNS)))
+
+    # 1件多く取得して次のページの有無を判定する
+    rows = db.execute(query.limit(limit + 1)).scalars().all()
+    next_cursor = rows[limit - 1].id if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def _get_estimate(db: Session, estimate_id: int):
+    return db.get(Estimate, estimate_id, options=[undefer_group("documents")])
+
+
+async def search_estimates(db: Session, q: Optional[str] = None, email: Optional[str] = None,
+                           cursor: Optional[int] = None, limit: int = 20):
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    return await run_db(_search_estimates, db, q, email, cursor, limit)
+
+
+async def get_estimate(db: Session, estimate_id: int):
+    return await run_db(_get_estimate, db, estimate_id)
@@ -1,19 +1,20 @@
 import uuid
+from app.services.form_store import form_store
 
-# インメモリデータストア（本番環境では適切なデータベースを使用してください）
-forms = {}
+# 保存先は FORM_STORE_BACKEND で切り替える（memory: 単一プロセス用, database: 複数ワーカー・インスタンスで共有）
 
 async def save_form_data(form):
-    if form.id and form.id in forms:
-        forms[form.id] = form.answers
+    if form.id and await form_store.get(form.id) is not None:
+        await form_store.set(form.id, form.answers)
     else:
         new_id = str(uuid.uuid4())
-        forms[new_id] = form.answers
+        await form_store.set(new_id, form.answers)
         form.id = new_id
     return {"id": form.id}
 
 async def load_form_data(form_id: str):
-    if form_id in forms:
-        return {"answers": forms[form_id]}
+    answers = await form_store.get(form_id)
+    if answers is not None:
+        return {"answers": answers}
     else:
-        return None
\ No newline at end of file
+        return None
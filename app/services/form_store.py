@@ -0,0 +1,117 @@
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import List, Optional
+
+from app.database import SessionLocal, run_db
+from app.models.form import SavedForm
+
+
+class FormStore(ABC):
+    """フォーム回答の保存先のインターフェース"""
+
+    @abstractmethod
+    async def get(self, form_id: str) -> Optional[List[str]]:
+        ...
+
+    @abstractmethod
+    async def set(self, form_id: str, answers: List[str]):
+        ...
+
+    @abstractmethod
+    async def delete(self, form_id: str):
+        ...
+
+
+class MemoryFormStore(FormStore):
+    """件数・バイト数の上限とTTLを持つLRUのインメモリストア（単一プロセス向け）"""
+
+    def __init__(self, max_entries: int = 10000, max_bytes: int = 64 * 1024 * 1024, ttl: float = 7 * 86400):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.total_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _remove(self, form_id: str):
+        _, _, size = self._entries.pop(form_id)
+        self.total_bytes -= size
+
+    async def get(self, form_id: str) -> Optional[List[str]]:
+        with self._lock:
+            entry = self._entries.get(form_id)
+            if entry is None:
+                return None
+            expires_at, answers, _ = entry
+            if expires_at < time.monotonic():
+                self._remove(form_id)
+                return None
+            self._entries.move_to_end(form_id)
+            return answers
+
+    async def set(self, form_id: str, answers: List[str]):
+        size = len(json.dumps(answers, ensure_ascii=False).encode("utf-8"))
+        with self._lock:
+            if form_id in self._entries:
+                self._remove(form_id)
+            self._entries[form_id] = (time.monotonic() + self.ttl, answers, size)
+            self.total_bytes += size
+            # 上限を超えたら最も古く使われたものから削除する
+            while self._entries and (len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+
+    async def delete(self, form_id: str):
+        with self._lock:
+            if form_id in self._entries:
+                self._remove(form_id)
+
+
+class DatabaseFormStore(FormStore):
+    """app/database.py のエンジンを使う永続ストア（複数ワーカー・インスタンスで共有される）"""
+
+    def __init__(self, session_factory=SessionLocal):
+        self.session_factory = session_factory
+
+    def _get(self, form_id: str):
+        with self.session_factory() as db:
+            form = db.get(SavedForm, form_id)
+            return json.loads(form.answers) if form else None
+
+    def _set(self, form_id: str, answers: List[str]):
+        with self.session_factory() as db:
+            db.merge(SavedForm(id=form_id, answers=json.dumps(answers, ensure_ascii=False)))
+            db.commit()
+
+    def _delete(self, form_id: str):
+        with self.session_factory() as db:
+            db.query(SavedForm).filter(SavedForm.id == form_id).delete()
+            db.commit()
+
+    async def get(self, form_id: str) -> Optional[List[str]]:
+        return await run_db(self._get, form_id)
+
+    async def set(self, form_id: str, answers: List[str]):
+        await run_db(self._set, form_id, answers)
+
+    async def delete(self, form_id: str):
+        await run_db(self._delete, form_id)
+
+
+def create_form_store() -> FormStore:
+    backend = os.getenv("FORM_STORE_BACKEND", "memory").lower()
+    if backend == "database":
+        return DatabaseFormStore()
+    if backend == "memory":
+        return MemoryFormStore(
+            max_entries=int(os.getenv("FORM_STORE_MAX_ENTRIES", "10000")),
+            max_bytes=int(os.getenv("FORM_STORE_MAX_BYTES", str(64 * 1024 * 1024))),
+            ttl=float(os.getenv("FORM_STORE_TTL", str(7 * 86400))),
+        )
+    raise ValueError(f"Unknown FORM_STORE_BACKEND: {backend}")
+
+
+form_store = create_form_store()
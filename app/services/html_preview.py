@@ -0,0 +1,103 @@
+import hashlib
+import os
+import re
+from functools import lru_cache
+from typing import Optional
+
+from app.services.llm_cache import LLMCache, MemoryCache, SQLiteCache
+
+# 整形済みのHTMLを保持する件数（LLMの応答の内容ごとにキャッシュする）
+PREVIEW_RENDER_CACHE_SIZE = int(os.getenv("PREVIEW_RENDER_CACHE_SIZE", "256"))
+# GET /previews/{id} で返すHTMLの保存先。LLMのキャッシュとは別に持ち、その設定や追い出しの影響を受けない
+# （0件にすると保存せず、preview_id も返さない。複数プロセスで共有するには SQLite のパスを指定する）
+PREVIEW_STORE_MAX_ENTRIES = int(os.getenv("PREVIEW_STORE_MAX_ENTRIES", "1000"))
+PREVIEW_STORE_TTL = float(os.getenv("PREVIEW_STORE_TTL", "86400"))
+PREVIEW_STORE_SQLITE_PATH = os.getenv("PREVIEW_STORE_SQLITE_PATH")
+
+CODE_BLOCK_PATTERN = re.compile(r"```[\w+-]*[ \t]*\n(.*?)(?:```|\Z)", re.DOTALL)
+# 中身の空白に意味がある要素。script と style は行頭の空白だけを詰める
+PROTECTED_PATTERN = re.compile(r"(<(pre|textarea|script|style)\b.*?</\2\s*>)", re.DOTALL | re.IGNORECASE)
+COMMENT_PATTERN = re.compile(r"<!--(?!\[if).*?-->", re.DOTALL)
+# 画面間で共通になりやすい外部の script / stylesheet（Tailwind CDN など）
+ASSET_PATTERN = re.compile(
+    r"<script\b[^>]*\bsrc=[^>]*>\s*</script\s*>|<link\b[^>]*\brel=[\"']?stylesheet[^>]*>",
+    re.IGNORECASE,
+)
+
+
+def extract_code_block(content: str) -> str:
+    """コードブロックの中身を返す。複数あれば最も長いもの、無ければ応答全体"""
+    blocks = CODE_BLOCK_PATTERN.findall(content)
+    if not blocks:
+        return content.strip()
+    return max(blocks, key=len).strip()
+
+
+def _strip_lines(text: str) -> str:
+    return "\n".join(line.strip() for line in text.splitlines() if line.strip())
+
+
+def minify_html(html: str) -> str:
+    # 行頭・行末の空白と空行、コメントを取り除く（改行は残すので表示は変わらない）
+    parts = []
+    for index, part in enumerate(PROTECTED_PATTERN.split(html)):
+        if index % 3 == 2:
+            continue  # split で返るタグ名のグループ
+        if index % 3 == 1:
+            parts.append(part if part[1:4].lower() in ("pre", "tex") else _strip_lines(part))
+        else:
+            parts.append(_strip_lines(COMMENT_PATTERN.sub("", part)))
+    return "\n".join(part for part in parts if part)
+
+
+@lru_cache(maxsize=PREVIEW_RENDER_CACHE_SIZE)
+def render_preview_html(content: str) -> str:
+    """LLMの応答（Markdown）からHTMLを取り出して圧縮する"""
+    return minify_html(extract_code_block(content))
+
+
+def split_shared_assets(documents):
+    """全てのHTMLに含まれる外部の script / stylesheet のタグを取り出し、(タグの一覧, 取り除いたHTMLの一覧) を返す
+
+    None の要素はそのまま返す。共通のタグはクライアント側で各画面の head に1回ずつ挿入する。
+    """
+    tag_sets = [set(ASSET_PATTERN.findall(document)) for document in documents if document]
+    if not tag_sets:
+        return [], list(documents)
+    first = next(document for document in documents if document)
+    shared = list(dict.fromkeys(tag for tag in ASSET_PATTERN.findall(first) if all(tag in tags for tags in tag_sets)))
+    stripped = []
+    for document in documents:
+        if document:
+            for tag in shared:
+                document = document.replace(tag + "\n", "").replace(tag, "")
+        stripped.append(document)
+    return shared, stripped
+
+
+def preview_id(html: str) -> str:
+    return hashlib.sha256(html.encode("utf-8")).hexdigest()[:32]
+
+
+def _create_preview_store() -> LLMCache:
+    disk = None
+    if PREVIEW_STORE_SQLITE_PATH:
+        disk = SQLiteCache(PREVIEW_STORE_SQLITE_PATH, max_entries=PREVIEW_STORE_MAX_ENTRIES, ttl=PREVIEW_STORE_TTL)
+    memory = MemoryCache(max_entries=PREVIEW_STORE_MAX_ENTRIES, ttl=PREVIEW_STORE_TTL)
+    return LLMCache(memory, disk, enabled=PREVIEW_STORE_MAX_ENTRIES > 0)
+
+
+preview_store = _create_preview_store()
+
+
+async def store_preview(html: str) -> Optional[str]:
+    """HTMLを内容のハッシュをキーにして保存し、GET /previews/{id} で返せるようにする。保存しない設定なら None"""
+    if not preview_store.enabled:
+        return None
+    key = preview_id(html)
+    await preview_store.set(key, html)
+    return key
+
+
+async def load_preview(preview_id: str) -> Optional[str]:
+    return await preview_store.get(preview_id)
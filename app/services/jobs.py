@@ -0,0 +1,305 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_TTL = float(os.getenv("JOB_TTL", "3600"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))
+# この時間更新のない実行中ジョブは、落ちたワーカーのものとみなして再実行する
+JOB_STALE_TIMEOUT = float(os.getenv("JOB_STALE_TIMEOUT", "600"))
+# 実行中のジョブの updated_at を更新する間隔（JOB_STALE_TIMEOUT より十分短くする）
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", "60"))
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+def make_job_id(kind: str, payload) -> str:
+    # 同じ内容の投入は同じジョブにまとめる
+    canonical = json.dumps({"kind": kind, "payload": payload}, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class JobStore(ABC):
+    """ジョブの状態と結果の保存先"""
+
+    @abstractmethod
+    async def submit(self, job_id: str, kind: str, payload) -> dict:
+        ...
+
+    @abstractmethod
+    async def claim(self) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    async def heartbeat(self, job_id: str):
+        """実行中のジョブの updated_at を更新し、他のワーカーに再実行されないようにする"""
+
+    @abstractmethod
+    async def requeue(self, job_id: str):
+        """実行を中断したジョブを待機中に戻す"""
+
+    @abstractmethod
+    async def finish(self, job_id: str, status: str, result=None, error: str = None):
+        ...
+
+    @abstractmethod
+    async def get(self, job_id: str) -> Optional[dict]:
+        ...
+
+
+class MemoryJobStore(JobStore):
+    """単一プロセス用のインメモリストア"""
+
+    def __init__(self, ttl: float = JOB_TTL):
+        self.ttl = ttl
+        self._jobs = {}
+        self._queue = deque()
+
+    def _expire(self):
+        now = time.time()
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job["status"] in (SUCCEEDED, FAILED) and job["updated_at"] + self.ttl < now]:
+            del self._jobs[job_id]
+
+    async def submit(self, job_id: str, kind: str, payload) -> dict:
+        self._expire()
+        job = self._jobs.get(job_id)
+        if job is not None and job["status"] != FAILED:
+            return job
+        now = time.time()
+        job = {"id": job_id, "kind": kind, "payload": payload, "status": QUEUED,
+               "result": None, "error": None, "created_at": now, "updated_at": now}
+        self._jobs[job_id] = job
+        self._queue.append(job_id)
+        return job
+
+    async def claim(self) -> Optional[dict]:
+        while self._queue:
+            job = self._jobs.get(self._queue.popleft())
+            if job is not None and job["status"] == QUEUED:
+                job["status"] = RUNNING
+                job["updated_at"] = time.time()
+                return job
+        return None
+
+    async def heartbeat(self, job_id: str):
+        job = self._jobs.get(job_id)
+        if job is not None and job["status"] == RUNNING:
+            job["updated_at"] = time.time()
+
+    async def requeue(self, job_id: str):
+        job = self._jobs.get(job_id)
+        if job is not None and job["status"] == RUNNING:
+            job.update(status=QUEUED, updated_at=time.time())
+            self._queue.appendleft(job_id)
+
+    async def finish(self, job_id: str, status: str, result=None, error: str = None):
+        job = self._jobs.get(job_id)
+        if job is not None:
+            job.update(status=status, result=result, error=error, updated_at=time.time())
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        return self._jobs.get(job_id)
+
+
+class SQLiteJobStore(JobStore):
+    """複数ワーカープロセスで共有できるSQLiteストア"""
+
+    def __init__(self, path: str, ttl: float = JOB_TTL, stale_timeout: float = JOB_STALE_TIMEOUT):
+        self.ttl = ttl
+        self.stale_timeout = stale_timeout
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, kind TEXT NOT NULL, payload TEXT NOT NULL, status TEXT NOT NULL, "
+            "result TEXT, error TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)")
+
+    @staticmethod
+    def _row_to_job(row) -> dict:
+        job_id, kind, payload, status, result, error, created_at, updated_at = row
+        return {"id": job_id, "kind": kind, "payload": json.loads(payload), "status": status,
+                "result": json.loads(result) if result is not None else None, "error": error,
+                "created_at": created_at, "updated_at": updated_at}
+
+    def _select(self, job_id: str):
+        row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def _submit(self, job_id: str, kind: str, payload) -> dict:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?", (SUCCEEDED, FAILED, now - self.ttl)
+                )
+                job = self._select(job_id)
+                if job is None or job["status"] == FAILED:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, NULL, NULL, ?, ?)",
+                        (job_id, kind, json.dumps(payload, ensure_ascii=False), QUEUED, now, now),
+                    )
+                    job = self._select(job_id)
+                self._conn.execute("COMMIT")
+                return job
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _claim(self) -> Optional[dict]:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT id FROM jobs WHERE status = ? OR (status = ? AND updated_at < ?) "
+                    "ORDER BY created_at LIMIT 1",
+                    (QUEUED, RUNNING, now - self.stale_timeout),
+                ).fetchone()
+                job = None
+                if row is not None:
+                    self._conn.execute("UPDATE jobs SET status = ?, updated_at = ? WHERE id = ?", (RUNNING, now, row[0]))
+                    job = self._select(row[0])
+                self._conn.execute("COMMIT")
+                return job
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _set_running_status(self, job_id: str, status: str):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE id = ? AND status = ?",
+                (status, time.time(), job_id, RUNNING),
+            )
+
+    def _finish(self, job_id: str, status: str, result, error):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, updated_at = ? WHERE id = ?",
+                (status, json.dumps(result, ensure_ascii=False) if result is not None else None, error, time.time(), job_id),
+            )
+
+    def _get(self, job_id: str):
+        with self._lock:
+            return self._select(job_id)
+
+    async def submit(self, job_id: str, kind: str, payload) -> dict:
+        return await asyncio.to_thread(self._submit, job_id, kind, payload)
+
+    async def claim(self) -> Optional[dict]:
+        return await asyncio.to_thread(self._claim)
+
+    async def heartbeat(self, job_id: str):
+        await asyncio.to_thread(self._set_running_status, job_id, RUNNING)
+
+    async def requeue(self, job_id: str):
+        await asyncio.to_thread(self._set_running_status, job_id, QUEUED)
+
+    async def finish(self, job_id: str, status: str, result=None, error: str = None):
+        await asyncio.to_thread(self._finish, job_id, status, result, error)
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        return await asyncio.to_thread(self._get, job_id)
+
+
+class JobManager:
+    """上限付きのワーカーでジョブを実行する"""
+
+    def __init__(self, store: JobStore, handlers: dict, workers: int = JOB_WORKERS,
+                 heartbeat_interval: float = JOB_HEARTBEAT_INTERVAL):
+        self.store = store
+        self.handlers = handlers
+        self.workers = workers
+        self.heartbeat_interval = heartbeat_interval
+        self._tasks = []
+        self._wakeup = None
+
+    async def start(self):
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, kind: str, payload) -> dict:
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        job = await self.store.submit(make_job_id(kind, payload), kind, payload)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        return await self.store.get(job_id)
+
+    async def _worker(self):
+        while True:
+            self._wakeup.clear()
+            job = await self.store.claim()
+            if job is None:
+                # 新しいジョブの通知か、他プロセスが投入したジョブのポーリングを待つ
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=JOB_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            heartbeat = asyncio.create_task(self._heartbeat(job["id"]))
+            try:
+                result = await self.handlers[job["kind"]](job["payload"])
+                await self.store.finish(job["id"], SUCCEEDED, result=result)
+            except asyncio.CancelledError:
+                # 停止で中断したジョブは実行中のまま残さず、次に起動したワーカーが実行できるよう戻す
+                await self.store.requeue(job["id"])
+                raise
+            except Exception as e:
+                logger.exception("Job %s (%s) failed", job["id"], job["kind"])
+                await self.store.finish(job["id"], FAILED, error=str(e))
+            finally:
+                heartbeat.cancel()
+
+    async def _heartbeat(self, job_id: str):
+        # 実行時間が JOB_STALE_TIMEOUT を超えても、落ちたワーカーのジョブと誤認されないようにする
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                await self.store.heartbeat(job_id)
+            except Exception:
+                logger.exception("Failed to update heartbeat of job %s", job_id)
+
+
+def create_job_store() -> JobStore:
+    sqlite_path = os.getenv("JOB_QUEUE_SQLITE_PATH")
+    if sqlite_path:
+        return SQLiteJobStore(sqlite_path)
+    return MemoryJobStore()
+
+
+def public_job(job: dict) -> dict:
+    return {
+        "job_id": job["id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "result": job["result"],
+        "error": job["error"],
+    }
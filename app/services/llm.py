@@ -0,0 +1,513 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import logging
+import os
+import random
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+from app.services.llm_cache import llm_cache, make_cache_key
+from app.services.llm_logging import log_llm_call
+from app.services.metrics import add_server_timing, llm_errors, llm_request_duration, llm_tokens, register_collector
+
+logger = logging.getLogger(__name__)
+
+# 優先度（小さいほど優先）。対話的なリクエストがバックグラウンド処理より先にスケジュールされる
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "20"))
+# モデルごとの1分あたりのリクエスト数・トークン数の上限（0で無制限）。OpenAIの上限はモデル単位のため、モデルごとにバケットを持つ
+# 既定で有効になっているため、APIキーの上限に合わせて設定すること（LLM_MODEL_RATE_LIMITS でモデル別に指定できる）
+LLM_RPM_LIMIT = int(os.getenv("LLM_RPM_LIMIT", "500"))
+LLM_TPM_LIMIT = int(os.getenv("LLM_TPM_LIMIT", "200000"))
+# 上限はプロセスごとに適用されるため、同じAPIキーを使うプロセス数（ワーカー数×インスタンス数）で割って配分する
+LLM_RATE_LIMIT_PROCESSES = max(1, int(os.getenv("LLM_RATE_LIMIT_PROCESSES", os.getenv("WEB_CONCURRENCY", "1"))))
+LLM_EXPECTED_COMPLETION_TOKENS = int(os.getenv("LLM_EXPECTED_COMPLETION_TOKENS", "500"))
+
+
+def _parse_model_priorities(value: str):
+    # 例: "gpt-4o-mini=0,gpt-3.5-turbo=5"
+    priorities = {}
+    for item in value.split(","):
+        if "=" in item:
+            model, priority = item.split("=", 1)
+            priorities[model.strip()] = int(priority)
+    return priorities
+
+
+LLM_MODEL_PRIORITIES = _parse_model_priorities(os.getenv("LLM_MODEL_PRIORITIES", ""))
+
+
+def _parse_model_rate_limits(value: str):
+    # 例: "gpt-4o-mini=5000:2000000,gpt-3.5-turbo=3500:160000"（モデル=RPM:TPM）
+    limits = {}
+    for item in value.split(","):
+        if "=" in item:
+            model, limit = item.split("=", 1)
+            rpm, tpm = limit.split(":", 1)
+            limits[model.strip()] = (int(rpm), int(tpm))
+    return limits
+
+
+LLM_MODEL_RATE_LIMITS = _parse_model_rate_limits(os.getenv("LLM_MODEL_RATE_LIMITS", ""))
+
+# JSONスキーマによる構造化出力（strict）に対応したモデル（前方一致）。それ以外はJSONモードを使う
+LLM_STRUCTURED_OUTPUT_MODELS = tuple(
+    prefix.strip() for prefix in os.getenv("LLM_STRUCTURED_OUTPUT_MODELS", "gpt-4o,gpt-4.1,o1,o3").split(",") if prefix.strip()
+)
+
+
+def _strict_schema(schema: dict) -> dict:
+    # strict モードでは全プロパティが必須かつ追加プロパティ不可である必要がある
+    schema = dict(schema)
+    if schema.get("type") == "object":
+        schema["additionalProperties"] = False
+        schema["required"] = list(schema.get("properties", {}))
+    return schema
+
+
+def json_response_format(model: str, name: str, schema: dict) -> dict:
+    # JSONモードではスキーマは強制されないため、呼び出し側で検証すること
+    if model.startswith(LLM_STRUCTURED_OUTPUT_MODELS):
+        return {"type": "json_schema", "json_schema": {"name": name, "strict": True, "schema": _strict_schema(schema)}}
+    return {"type": "json_object"}
+
+_priority = contextvars.ContextVar("llm_priority", default=None)
+# single-flight で共有している呼び出しの情報（合流した呼び出し元の優先度を反映するため）
+_current_flight = contextvars.ContextVar("llm_flight", default=None)
+
+
+@contextmanager
+def llm_priority(priority: int):
+    # このコンテキスト内で発行されるLLM呼び出しの優先度を設定する
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def _resolve_priority(model: str) -> int:
+    priority = _priority.get()
+    if priority is not None:
+        return priority
+    return LLM_MODEL_PRIORITIES.get(model, PRIORITY_INTERACTIVE)
+
+
+class RateLimitScheduler:
+    """リクエスト数・トークン数のトークンバケットで呼び出しを待たせ、優先度順に実行する"""
+
+    def __init__(self, rpm: int, tpm: int):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._requests = float(rpm)
+        self._tokens = float(tpm)
+        self._updated = time.monotonic()
+        self._waiters = []
+        self._counter = itertools.count()
+        self._timer = None
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        if self.rpm:
+            self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+        if self.tpm:
+            self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+
+    def _wait_time(self, tokens: int) -> float:
+        wait = 0.0
+        if self.rpm and self._requests < 1:
+            wait = max(wait, (1 - self._requests) * 60 / self.rpm)
+        if self.tpm:
+            # バケット容量を超える要求は満タンになった時点で通す
+            needed = min(tokens, self.tpm)
+            if self._tokens < needed:
+                wait = max(wait, (needed - self._tokens) * 60 / self.tpm)
+        return wait
+
+    def _schedule(self):
+        self._timer = None
+        self._refill()
+        while self._waiters:
+            _, _, tokens, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            wait = self._wait_time(tokens)
+            if wait > 0:
+                self._timer = asyncio.get_running_loop().call_later(wait, self._schedule)
+                return
+            heapq.heappop(self._waiters)
+            if self.rpm:
+                self._requests -= 1
+            if self.tpm:
+                self._tokens -= tokens
+            future.set_result(None)
+
+    async def acquire(self, tokens: int, priority: int = PRIORITY_INTERACTIVE, flight: Optional[dict] = None):
+        if not self.rpm and not self.tpm:
+            return
+        future = asyncio.get_running_loop().create_future()
+        entry = [priority, next(self._counter), tokens, future]
+        heapq.heappush(self._waiters, entry)
+        if self._timer is not None:
+            self._timer.cancel()
+        self._schedule()
+        if flight is None:
+            await future
+            return
+        # 待機中に優先度の高い呼び出し元が合流したら reprioritize で順番を繰り上げる
+        flight["pending"] = (self, entry)
+        try:
+            await future
+        finally:
+            flight["pending"] = None
+
+    def reprioritize(self, entry: list, priority: int):
+        if entry[3].done() or priority >= entry[0]:
+            return
+        entry[0] = priority
+        heapq.heapify(self._waiters)
+        if self._timer is not None:
+            self._timer.cancel()
+        self._schedule()
+
+    def record_usage(self, estimated_tokens: int, actual_tokens: Optional[int]):
+        # 見積もりと実際のトークン使用量の差分をバケットに反映する
+        if self.tpm and actual_tokens is not None:
+            self._tokens = min(self.tpm, self._tokens + estimated_tokens - actual_tokens)
+
+
+_client = None
+_schedulers = {}
+
+
+def get_client():
+    # アプリケーション全体で1つのクライアント（コネクションプール）を共有する
+    # openai/httpx の読み込みは重いため、起動時ではなく初回呼び出し時に行う
+    global _client
+    if _client is None:
+        import httpx
+        from openai import AsyncOpenAI
+
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(LLM_TIMEOUT, connect=10.0),
+        )
+        # リトライは _create_with_retry で行うため、SDK側のリトライは無効にする
+        _client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=http_client, max_retries=0)
+    return _client
+
+
+def preload_client_modules():
+    import httpx  # noqa: F401
+    import openai  # noqa: F401
+
+
+def _per_process(limit: int) -> int:
+    return max(1, limit // LLM_RATE_LIMIT_PROCESSES) if limit else 0
+
+
+def get_scheduler(model: str) -> RateLimitScheduler:
+    scheduler = _schedulers.get(model)
+    if scheduler is None:
+        rpm, tpm = LLM_MODEL_RATE_LIMITS.get(model, (LLM_RPM_LIMIT, LLM_TPM_LIMIT))
+        scheduler = _schedulers[model] = RateLimitScheduler(_per_process(rpm), _per_process(tpm))
+    return scheduler
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+
+def _estimate_tokens(system_prompt: str, prompt: str) -> int:
+    # 日本語は概ね1文字1トークン以下なので文字数を上限の見積もりとして使う
+    return len(system_prompt) + len(prompt) + LLM_EXPECTED_COMPLETION_TOKENS
+
+
+def _retry_delay(error: Exception, attempt: int) -> float:
+    response = getattr(error, "response", None)
+    if response is not None:
+        retry_after = response.headers.get("retry-after")
+        if retry_after:
+            try:
+                return min(float(retry_after), LLM_RETRY_MAX_DELAY)
+            except ValueError:
+                pass
+    # フルジッター付きの指数バックオフ
+    return random.uniform(0, min(LLM_RETRY_MAX_DELAY, LLM_RETRY_BASE_DELAY * 2 ** attempt))
+
+
+def _retryable_errors():
+    import openai
+    return (
+        openai.RateLimitError,
+        openai.APIConnectionError,
+        openai.InternalServerError,
+    )
+
+
+async def _create_with_retry(model: str, system_prompt: str, prompt: str, **kwargs):
+    scheduler = get_scheduler(model)
+    flight = _current_flight.get()
+    estimated_tokens = _estimate_tokens(system_prompt, prompt)
+    retryable_errors = _retryable_errors()
+    attempt = 0
+    while True:
+        # single-flight で共有している場合は、合流した呼び出し元のうち最も高い優先度で待つ
+        priority = flight["priority"] if flight is not None else _resolve_priority(model)
+        await scheduler.acquire(estimated_tokens, priority, flight)
+        try:
+            return estimated_tokens, await get_client().chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": prompt}
+                ],
+                **kwargs,
+            )
+        except retryable_errors as e:
+            if attempt >= LLM_MAX_RETRIES:
+                raise
+            delay = _retry_delay(e, attempt)
+            logger.warning("OpenAI call failed (%s), retrying in %.2fs (attempt %d)", type(e).__name__, delay, attempt + 1)
+            attempt += 1
+            await asyncio.sleep(delay)
+
+
+class SingleFlight:
+    """同じキーの呼び出しが実行中なら、新たに呼び出さずその結果を共有する"""
+
+    def __init__(self):
+        self.calls = 0
+        self.deduplicated = 0
+        self._inflight = {}
+
+    async def do(self, key: str, func, priority: int = PRIORITY_INTERACTIVE):
+        flight = self._inflight.get(key)
+        if flight is None:
+            self.calls += 1
+            flight = self._inflight[key] = {"waiters": 0, "priority": priority, "pending": None}
+
+            async def run():
+                _current_flight.set(flight)
+                return await func()
+
+            # 最初の呼び出し元がキャンセルされても他の待機者のために処理を続けるよう、別タスクで実行する
+            flight["task"] = asyncio.ensure_future(run())
+            flight["task"].add_done_callback(lambda t: self._done(key, t))
+        else:
+            self.deduplicated += 1
+            if priority < flight["priority"]:
+                # バックグラウンドの呼び出しに対話的な呼び出し元が合流したら、共有の呼び出しの優先度を上げる
+                flight["priority"] = priority
+                if flight["pending"] is not None:
+                    scheduler, entry = flight["pending"]
+                    scheduler.reprioritize(entry, priority)
+        task = flight["task"]
+        flight["waiters"] += 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            flight["waiters"] -= 1
+            # 待機者が全員キャンセルされたら、上流の呼び出しも取り消す（タイムアウトや切断で止まるように）
+            if flight["waiters"] == 0 and not task.done():
+                task.cancel()
+                if self._inflight.get(key) is flight:
+                    del self._inflight[key]  # 後から来た呼び出しは取り消し中のタスクに合流させない
+
+    def _done(self, key: str, task):
+        flight = self._inflight.get(key)
+        if flight is not None and flight["task"] is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # 待機者がいなくなった場合の未取得例外の警告を抑止する
+
+    def stats(self):
+        return {"calls": self.calls, "deduplicated": self.deduplicated, "in_flight": len(self._inflight)}
+
+
+llm_singleflight = SingleFlight()
+
+
+def _count_tokens(name: str, model: str, usage):
+    if usage is not None:
+        llm_tokens.inc(usage.prompt_tokens or 0, name=name, model=model, type="prompt")
+        llm_tokens.inc(usage.completion_tokens or 0, name=name, model=model, type="completion")
+
+
+def _record_call(name: str, model: str, key: str, started: float, prompt: str,
+                 content: Optional[str] = None, usage=None, cached: bool = False, error: Optional[BaseException] = None):
+    latency = time.perf_counter() - started
+    llm_request_duration.observe(latency, name=name, model=model, cached=str(cached).lower())
+    if error is not None:
+        llm_errors.inc(name=name, model=model)
+    add_server_timing(f"llm.{name}", latency)
+    log_llm_call(name, model, key, latency, prompt, content, usage=usage, cached=cached, error=error)
+
+
+class LLMRefusal(Exception):
+    """モデルが応答を拒否した（構造化出力の refusal など、content が空の応答）"""
+
+
+async def _complete(key: str, name: str, model: str, system_prompt: str, prompt: str, validate=None, **kwargs):
+    estimated_tokens, response = await _create_with_retry(model, system_prompt, prompt, **kwargs)
+    usage = getattr(response, "usage", None)
+    get_scheduler(model).record_usage(estimated_tokens, usage.total_tokens if usage else None)
+    _count_tokens(name, model, usage)
+    message = response.choices[0].message
+    if message.content is None:
+        raise LLMRefusal(getattr(message, "refusal", None) or "The model returned no content")
+    content = message.content.strip()
+    if validate is not None:
+        validate(content)  # 検証に失敗した応答はキャッシュしない
+    await llm_cache.set(key, content)
+    return content, usage
+
+
+class BatchRequestPending(Exception):
+    """オフライン処理中に、結果がまだ無いリクエストが発行された"""
+
+
+class OfflineBatch:
+    """LLMを呼び出さずにリクエストを集め、Batch APIの結果が揃っていればそれを返す
+
+    キーは create_chat_completion のキャッシュキーと同じもので、Batch APIの custom_id に使う。
+    """
+
+    def __init__(self, responses: dict = None):
+        self.responses = responses or {}
+        self.requests = {}
+
+    def respond(self, key: str, model: str, system_prompt: str, prompt: str, kwargs: dict) -> str:
+        if key in self.responses:
+            return self.responses[key]
+        self.requests[key] = {
+            "model": model,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": prompt},
+            ],
+            **kwargs,
+        }
+        raise BatchRequestPending(key)
+
+
+_offline_batch = contextvars.ContextVar("offline_batch", default=None)
+
+
+@contextmanager
+def offline_batch(batch: OfflineBatch):
+    # このコンテキスト内の create_chat_completion はAPIを呼び出さず batch を使う
+    token = _offline_batch.set(batch)
+    try:
+        yield batch
+    finally:
+        _offline_batch.reset(token)
+
+
+async def create_chat_completion(model: str, system_prompt: str, prompt: str, name: str = "chat_completion",
+                                 response_format=None, validate=None) -> str:
+    # response_format を指定すると構造化出力（JSONモード・JSONスキーマ）で呼び出す
+    # validate は応答を検証する関数で、例外を送出した応答はキャッシュに保存せず、キャッシュにあっても使わない
+    key = make_cache_key(model, system_prompt, prompt, response_format)
+    kwargs = {} if response_format is None else {"response_format": response_format}
+    batch = _offline_batch.get()
+    if batch is not None:
+        return batch.respond(key, model, system_prompt, prompt, kwargs)
+    started = time.perf_counter()
+    cached = await llm_cache.get(key)
+    if cached is not None and validate is not None:
+        try:
+            validate(cached)
+        except Exception:
+            cached = None
+    if cached is not None:
+        _record_call(name, model, key, started, prompt, cached, cached=True)
+        return cached
+
+    try:
+        content, usage = await llm_singleflight.do(
+            key,
+            lambda: _complete(key, name, model, system_prompt, prompt, validate=validate, **kwargs),
+            priority=_resolve_priority(model),
+        )
+    except Exception as e:
+        _record_call(name, model, key, started, prompt, error=e)
+        raise
+    _record_call(name, model, key, started, prompt, content, usage=usage)
+    return content
+
+
+async def stream_chat_completion(model: str, system_prompt: str, prompt: str, name: str = "chat_completion"):
+    # 生成されたトークンを順次返す。キャッシュ済みの場合は全文を一度に返す
+    # single-flight と OfflineBatch は通さないため、同じ内容の同時のストリーミング要求はそれぞれ上流を呼び出す
+    key = make_cache_key(model, system_prompt, prompt)
+    started = time.perf_counter()
+    cached = await llm_cache.get(key)
+    if cached is not None:
+        _record_call(name, model, key, started, prompt, cached, cached=True)
+        yield cached
+        return
+
+    chunks = []
+    usage = None
+    stream = None
+    try:
+        estimated_tokens, stream = await _create_with_retry(
+            model, system_prompt, prompt, stream=True, stream_options={"include_usage": True}
+        )
+        async for chunk in stream:
+            if getattr(chunk, "usage", None) is not None:
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                chunks.append(delta)
+                yield delta
+    except Exception as e:
+        _record_call(name, model, key, started, prompt, error=e)
+        raise
+    finally:
+        # クライアントの切断でキャンセル・中断された場合も、上流の接続をすぐにプールへ返す
+        if stream is not None:
+            await stream.close()
+    content = "".join(chunks).strip()
+    get_scheduler(model).record_usage(estimated_tokens, usage.total_tokens if usage else None)
+    _count_tokens(name, model, usage)
+    _record_call(name, model, key, started, prompt, content, usage=usage)
+    await llm_cache.set(key, content)
+
+
+@register_collector
+def _collect_llm_stats():
+    cache = llm_cache.stats()
+    singleflight = llm_singleflight.stats()
+    return [
+        ("llm_cache_hits_total", "counter", "LLM response cache hits.", cache["hits"]),
+        ("llm_cache_misses_total", "counter", "LLM response cache misses.", cache["misses"]),
+        ("llm_cache_memory_entries", "gauge", "Entries in the in-process LLM response cache.", cache["memory_entries"]),
+        ("llm_singleflight_calls_total", "counter", "Upstream LLM calls started by the single-flight layer.", singleflight["calls"]),
+        ("llm_singleflight_deduplicated_total", "counter", "LLM calls served by an identical in-flight call.", singleflight["deduplicated"]),
+        ("llm_singleflight_in_flight", "gauge", "LLM calls currently in flight.", singleflight["in_flight"]),
+    ]
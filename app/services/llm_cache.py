@@ -0,0 +1,192 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+def make_cache_key(model: str, system_prompt: str, user_prompt: str, response_format=None) -> str:
+    # (モデル, システムプロンプト, ユーザープロンプト) を正規化したJSONのハッシュをキーにする
+    key = {"model": model, "system": system_prompt, "user": user_prompt}
+    if response_format is not None:
+        key["response_format"] = response_format
+    payload = json.dumps(
+        key,
+        ensure_ascii=False,
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class MemoryCache:
+    """プロセス内のTTL付きLRUキャッシュ"""
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteCache:
+    """ディスク上のTTL付きLRUキャッシュ（プロセス・ワーカー間で共有可能）"""
+
+    def __init__(self, path: str, max_entries: int = 10000, ttl: float = 86400):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_accessed ON llm_cache (accessed_at)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at < now:
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            return value
+
+    def set(self, key: str, value: str):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, now + self.ttl, now),
+            )
+            self._conn.execute("DELETE FROM llm_cache WHERE expires_at < ?", (now,))
+            # 上限を超えた分は最終アクセスが古い順に削除する
+            self._conn.execute(
+                "DELETE FROM llm_cache WHERE key IN ("
+                "SELECT key FROM llm_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+
+
+class LLMCache:
+    """メモリ層と任意のディスク層からなる2段キャッシュ"""
+
+    def __init__(self, memory: MemoryCache, disk=None, enabled: bool = True):
+        self.memory = memory
+        self.disk = disk
+        self.enabled = enabled
+        self.hits = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    async def get(self, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        value = self.memory.get(key)
+        if value is not None:
+            self.hits += 1
+            self.memory_hits += 1
+            return value
+        if self.disk is not None:
+            value = await asyncio.to_thread(self.disk.get, key)
+            if value is not None:
+                self.hits += 1
+                self.disk_hits += 1
+                self.memory.set(key, value)
+                return value
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: str):
+        if not self.enabled:
+            return
+        self.memory.set(key, value)
+        if self.disk is not None:
+            await asyncio.to_thread(self.disk.set, key, value)
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "memory_entries": len(self.memory),
+        }
+
+
+def _create_cache() -> LLMCache:
+    ttl = float(os.getenv("LLM_CACHE_TTL", "3600"))
+    memory = MemoryCache(max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1024")), ttl=ttl)
+    disk = None
+    sqlite_path = os.getenv("LLM_CACHE_SQLITE_PATH")
+    if sqlite_path:
+        disk = SQLiteCache(
+            sqlite_path,
+            max_entries=int(os.getenv("LLM_CACHE_DISK_MAX_ENTRIES", "10000")),
+            ttl=float(os.getenv("LLM_CACHE_DISK_TTL", str(ttl))),
+        )
+    enabled = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+    return LLMCache(memory, disk, enabled=enabled)
+
+
+# 全サービスモジュールで共有するキャッシュ
+llm_cache = _create_cache()
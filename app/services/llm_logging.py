@@ -0,0 +1,93 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import re
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+# LLM呼び出しの構造化ログ用ロガー
+llm_logger = logging.getLogger("app.llm")
+
+# 成功した呼び出しを記録する割合（エラーは常に記録する）
+LLM_LOG_SAMPLE_RATE = float(os.getenv("LLM_LOG_SAMPLE_RATE", "0.1"))
+LLM_LOG_MAX_CHARS = int(os.getenv("LLM_LOG_MAX_CHARS", "200"))
+LLM_LOG_CONTENT = os.getenv("LLM_LOG_CONTENT", "true").lower() == "true"
+
+# 個人情報と思われる文字列はログに残さない
+REDACTION_PATTERNS = (
+    (re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+"), "[EMAIL]"),
+    (re.compile(r"\+?\d[\d-]{8,}\d"), "[PHONE]"),
+)
+
+_listener = None
+
+
+def setup_logging(level: str = None):
+    # ログ出力はキュー経由で別スレッドに任せ、リクエスト処理中のI/Oを避ける
+    global _listener
+    if _listener is not None:
+        return
+    log_queue = queue.SimpleQueue()
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(levelname)s:%(name)s:%(message)s"))
+    _listener = QueueListener(log_queue, handler, respect_handler_level=True)
+
+    root = logging.getLogger()
+    root.handlers = [QueueHandler(log_queue)]
+    root.setLevel(level or os.getenv("LOG_LEVEL", "INFO"))
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+def redact(text: str) -> str:
+    for pattern, replacement in REDACTION_PATTERNS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def _truncate(text: str) -> str:
+    text = redact(text)
+    if len(text) > LLM_LOG_MAX_CHARS:
+        return text[:LLM_LOG_MAX_CHARS] + f"...(+{len(text) - LLM_LOG_MAX_CHARS} chars)"
+    return text
+
+
+def log_llm_call(
+    name: str,
+    model: str,
+    prompt_hash: str,
+    latency: float,
+    prompt: str = "",
+    content: Optional[str] = None,
+    usage=None,
+    cached: bool = False,
+    error: Optional[BaseException] = None,
+):
+    if error is None and random.random() >= LLM_LOG_SAMPLE_RATE:
+        return
+    if not llm_logger.isEnabledFor(logging.INFO):
+        return
+    record = {
+        "event": "llm_call",
+        "name": name,
+        "model": model,
+        "prompt_hash": prompt_hash[:16],
+        "latency_ms": round(latency * 1000, 1),
+        "cached": cached,
+        "prompt_chars": len(prompt),
+    }
+    if usage is not None:
+        record["prompt_tokens"] = getattr(usage, "prompt_tokens", None)
+        record["completion_tokens"] = getattr(usage, "completion_tokens", None)
+    if LLM_LOG_CONTENT:
+        record["prompt"] = _truncate(prompt)
+        if content is not None:
+            record["content"] = _truncate(content)
+    if error is not None:
+        record["error"] = f"{type(error).__name__}: {error}"
+        llm_logger.warning(json.dumps(record, ensure_ascii=False))
+    else:
+        llm_logger.info(json.dumps(record, ensure_ascii=False))
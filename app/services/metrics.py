@@ -0,0 +1,137 @@
+import bisect
+import contextvars
+import threading
+
+# LLM呼び出しの所要時間向けのバケット（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+# プロンプトのトークン数向けのバケット
+TOKEN_BUCKETS = (100, 250, 500, 1000, 1500, 2000, 3000, 4000, 6000, 8000, 16000)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            counts, total, count = self._values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                counts[index] += 1
+            self._values[key] = (counts, total + value, count + 1)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    labels = _format_labels(self.labelnames, key, [("le", f"{bound:g}")])
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', '+Inf')])} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+llm_request_duration = Histogram(
+    "llm_request_duration_seconds", "Latency of LLM calls as seen by the caller.", ("name", "model", "cached")
+)
+llm_tokens = Counter("llm_tokens_total", "Tokens consumed by upstream LLM calls.", ("name", "model", "type"))
+llm_errors = Counter("llm_errors_total", "Failed LLM calls.", ("name", "model"))
+llm_prompt_tokens = Histogram(
+    "llm_prompt_tokens", "Locally counted prompt tokens per LLM call.", ("name", "model"), buckets=TOKEN_BUCKETS
+)
+llm_prompt_trimmed = Counter(
+    "llm_prompt_trimmed_total", "LLM calls whose answers were trimmed to fit the token budget.", ("name", "model")
+)
+db_operation_duration = Histogram("db_operation_duration_seconds", "Latency of database operations.", ("operation",))
+db_errors = Counter("db_errors_total", "Failed database operations.", ("operation",))
+screen_prefetches = Counter(
+    "screen_prefetch_total", "Speculative screen detail prefetches by how they ended.", ("result",)
+)
+
+REGISTRY = [
+    llm_request_duration, llm_tokens, llm_errors, llm_prompt_tokens, llm_prompt_trimmed,
+    db_operation_duration, db_errors, screen_prefetches,
+]
+
+# 外部で集計している値（キャッシュ・single-flight）をレンダリング時に取り込むための関数
+_collectors = []
+
+
+def register_collector(func):
+    # func は (名前, 種別, 説明, 値) のリストを返す
+    _collectors.append(func)
+    return func
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    for collector in _collectors:
+        for name, kind, documentation, value in collector():
+            lines.extend([f"# HELP {name} {documentation}", f"# TYPE {name} {kind}", f"{name} {value}"])
+    return "\n".join(lines) + "\n"
+
+
+# リクエスト単位の処理時間（Server-Timing ヘッダー用）
+_server_timings = contextvars.ContextVar("server_timings", default=None)
+
+
+def start_server_timing():
+    timings = []
+    _server_timings.set(timings)
+    return timings
+
+
+def add_server_timing(name: str, duration: float):
+    timings = _server_timings.get()
+    if timings is not None:
+        timings.append((name, duration))
+
+
+def record_db_operation(operation: str, duration: float, failed: bool):
+    # app.database.add_operation_observer に登録して run_db の処理時間を記録する
+    if failed:
+        db_errors.inc(operation=operation)
+    db_operation_duration.observe(duration, operation=operation)
+    add_server_timing(f"db.{operation}", duration)
+
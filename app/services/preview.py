@@ -1,14 +1,10 @@
 import asyncio  # Add this import statement
-from openai import AsyncOpenAI
-import os
 import logging  # Add this import statement
+from app.services.html_preview import render_preview_html
+from app.services.llm import create_chat_completion
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-aclient = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
 async def generate_title(answer):
     prompt = f"""
     以下のプロジェクト要件に基づいて、システム開発のパンフレットのタイトルを作成してください。
@@ -17,16 +13,13 @@ async def generate_title(answer):
     プロジェクト要件:
     {answer}
     """
-    logger.info(f"Generating title with prompt: {prompt}")
-    response = await aclient.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": "あなたはシステム開発の専門家で、システム発注が初めての方にも分かりやすい用語で説明することに自信を持っています。"},
-            {"role": "user", "content": prompt}
-        ]
+    content = await create_chat_completion(
+        "gpt-4o-mini",
+        "あなたはシステム開発の専門家で、システム発注が初めての方にも分かりやすい用語で説明することに自信を持っています。",
+        prompt,
+        name="generate_title",
     )
-    logger.info(f"Received response: {response}")
-    return response.choices[0].message.content.strip()
+    return content
 
 async def generate_catchphrase(answer):
     prompt = f"""
@@ -36,16 +29,13 @@ async def generate_catchphrase(answer):
     プロジェクト要件:
     {answer}
     """
-    logger.info(f"Generating catchphrase with prompt: {prompt}")
-    response = await aclient.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": "あなたはシステム開発の専門家で、システム発注が初めての方にも分かりやすい用語で説明することに自信を持っています。"},
-            {"role": "user", "content": prompt}
-        ]
+    content = await create_chat_completion(
+        "gpt-4o-mini",
+        "あなたはシステム開発の専門家で、システム発注が初めての方にも分かりやすい用語で説明することに自信を持っています。",
+        prompt,
+        name="generate_catchphrase",
     )
-    logger.info(f"Received response: {response}")
-    return response.choices[0].message.content.strip()
+    return content
 
 async def generate_description(answer):
     prompt = f"""
@@ -55,16 +45,13 @@ async def generate_description(answer):
     プロジェクト要件:
     {answer}
     """
-    logger.info(f"Generating description with prompt: {prompt}")
-    response = await aclient.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": "あなたはシステム開発の専門家で、システム発注が初めての方にも分かりやすい用語で説明することに自信を持っています。"},
-            {"role": "user", "content": prompt}
-        ]
+    content = await create_chat_completion(
+        "gpt-4o-mini",
+        "あなたはシステム開発の専門家で、システム発注が初めての方にも分かりやすい用語で説明することに自信を持っています。",
+        prompt,
+        name="generate_description",
     )
-    logger.info(f"Received response: {response}")
-    return response.choices[0].message.content.strip()
+    return content
 
 async def generate_preview_screen(screen):
     prompt = f"""
@@ -80,14 +67,12 @@ async def generate_preview_screen(screen):
 
     画面情報: {screen}
     """
-    logger.info(f"Generating preview screen with prompt: {prompt}")
-    response = await aclient.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": "あなたはフロントエンド開発の専門家かつUIデザイナーです。コードのみを提供し、説明は含めません。全てのイベントとリンクはJavaScriptのアラートで表示し、'〇〇が実行されます'という形式で記述します。"},
-            {"role": "user", "content": prompt}
-        ]
+    content = await create_chat_completion(
+        "gpt-4o-mini",
+        "あなたはフロントエンド開発の専門家かつUIデザイナーです。コードのみを提供し、説明は含めません。全てのイベントとリンクはJavaScriptのアラートで表示し、'〇〇が実行されます'という形式で記述します。",
+        prompt,
+        name="generate_preview_screen",
     )
-    logger.info(f"Received response: {response}")
-    return response.choices[0].message.content.strip()
+    # コードブロックを取り出し、空白を詰めたHTMLを返す
+    return render_preview_html(content)
 
@@ -0,0 +1,136 @@
+import json
+import logging
+import os
+import re
+from functools import lru_cache
+
+from app.services.metrics import llm_prompt_tokens, llm_prompt_trimmed
+
+logger = logging.getLogger(__name__)
+
+# 1回の呼び出しで送るプロンプト（システムプロンプトを含む）のトークン数の上限。0 は上限なし（回答を切り詰めない）
+# テンプレートだけで1.1k〜1.4kトークンあるため、指定する場合はモデルのコンテキスト長に近い値にする
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "0"))
+# 回答部分に最低限残すトークン数（テンプレートだけで上限を超える場合にも回答を落とさない）
+PROMPT_MIN_ANSWER_TOKENS = int(os.getenv("PROMPT_MIN_ANSWER_TOKENS", "300"))
+TRUNCATION_MARK = "…"
+
+_WHITESPACE = re.compile(r"\s+")
+# tiktoken が無い場合の概算用。CJK文字はおおむね1文字1トークン、それ以外は4文字1トークン程度
+_CJK = re.compile(r"[　-ヿ㐀-鿿豈-﫿＀-￯]")
+
+
+def _parse_budgets(value: str):
+    # 例: "create_screen_sample=2000,analyze_with_gpt=1500"（0 は上限なし）
+    budgets = {}
+    for item in value.split(","):
+        if "=" in item:
+            name, budget = item.split("=", 1)
+            budgets[name.strip()] = int(budget)
+    return budgets
+
+
+PROMPT_TOKEN_BUDGETS = _parse_budgets(os.getenv("PROMPT_TOKEN_BUDGETS", ""))
+
+
+@lru_cache(maxsize=None)
+def _get_encoding(model: str):
+    # tiktoken は任意の依存。入っていなければ文字種からの概算を使う
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text: str, model: str = "gpt-3.5-turbo") -> int:
+    encoding = _get_encoding(model)
+    if encoding is not None:
+        return len(encoding.encode(text))
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+@lru_cache(maxsize=256)
+def _count_static_tokens(text: str, model: str) -> int:
+    # テンプレート部分は呼び出しごとに変わらないので数え直さない
+    return count_tokens(text, model)
+
+
+def _sort_key(key):
+    key = str(key)
+    return (0, int(key), "") if key.isdigit() else (1, 0, key)
+
+
+def _format_value(value) -> str:
+    if isinstance(value, str):
+        return _WHITESPACE.sub(" ", value).strip()
+    if isinstance(value, (list, tuple)):
+        return "、".join(item for item in (_format_value(v) for v in value) if item)
+    if isinstance(value, dict):
+        return json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return "" if value is None else str(value)
+
+
+def serialize_answers(answers) -> list:
+    """回答を (質問キー, 値) の一覧にする。キー順に並べ、空の回答は除く"""
+    if not isinstance(answers, dict):
+        return [("", _format_value(answers))]
+    items = []
+    for key in sorted(answers, key=_sort_key):
+        value = _format_value(answers[key])
+        if value:
+            items.append((str(key), value))
+    return items
+
+
+def _render(items, limit=None) -> str:
+    lines = []
+    for key, value in items:
+        if limit is not None and len(value) > limit:
+            value = value[:limit] + TRUNCATION_MARK
+        lines.append(f"{key}: {value}" if key else value)
+    return "\n".join(lines)
+
+
+def format_answers(answers, max_tokens: int = None, model: str = "gpt-3.5-turbo"):
+    """回答を1行1問の形式で返す。max_tokens を超える場合は長い回答から順に切り詰める
+
+    戻り値は (テキスト, トークン数, 切り詰めたかどうか)。
+    """
+    items = serialize_answers(answers)
+    text = _render(items)
+    tokens = count_tokens(text, model)
+    if max_tokens is None or tokens <= max_tokens:
+        return text, tokens, False
+
+    # 各回答の最大文字数を二分探索し、上限に収まる最大の値を使う
+    low, high = 0, max(len(value) for _, value in items)
+    best = _render(items, 0)
+    while low <= high:
+        limit = (low + high) // 2
+        candidate = _render(items, limit)
+        if count_tokens(candidate, model) <= max_tokens:
+            best, low = candidate, limit + 1
+        else:
+            high = limit - 1
+    return best, count_tokens(best, model), True
+
+
+def build_budgeted_prompt(name: str, model: str, system_prompt: str, build, answers, budget: int = None) -> str:
+    """build(回答テキスト) でプロンプトを組み立て、トークン数の上限に収まるよう回答部分を切り詰める"""
+    if budget is None:
+        budget = PROMPT_TOKEN_BUDGETS.get(name, PROMPT_TOKEN_BUDGET)
+    overhead = _count_static_tokens(system_prompt + build(""), model)
+    max_tokens = max(PROMPT_MIN_ANSWER_TOKENS, budget - overhead) if budget > 0 else None
+    text, answer_tokens, trimmed = format_answers(answers, max_tokens, model)
+
+    total = overhead + answer_tokens
+    llm_prompt_tokens.observe(total, name=name, model=model)
+    if trimmed:
+        llm_prompt_trimmed.inc(name=name, model=model)
+        logger.info("Trimmed answers for %s to fit %d tokens (prompt is now %d tokens)", name, budget, total)
+    return build(text)
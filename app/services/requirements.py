@@ -1,54 +1,70 @@
-from openai import AsyncOpenAI
-import os
+from app.services.llm import create_chat_completion, stream_chat_completion
+from app.services.prompt_budget import build_budgeted_prompt
+from app.services.templates import PromptBuilder, template_registry
 
-aclient = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+system_requirements_specification_prompt = PromptBuilder(
+    template_registry,
+    "以下のプロジェクト要件に基づいて、システム要求仕様書の概要を作成してください。\n"
+    "詳細は省略し、主要なポイントのみを簡潔に記述してください。",
+    "System_Requirements_Specification",
+)
+
+requirements_definition_prompt = PromptBuilder(
+    template_registry,
+    "以下のプロジェクト要件に基づいて、要件定義書の概要を作成してください。\n"
+    "詳細は省略し、主要なポイントのみを簡潔に記述してください。",
+    "Requirements_Definition",
+)
+
+SYSTEM_REQUIREMENTS_SPECIFICATION_ROLE = "あなたはシステム要求仕様書の専門家です。簡潔に要点をまとめてください。"
+REQUIREMENTS_DEFINITION_ROLE = "あなたは要件定義の専門家です。簡潔に要点をまとめてください。"
+
+def build_system_requirements_specification_prompt(answers):
+    return build_budgeted_prompt(
+        "create_system_requirements_specification",
+        "gpt-3.5-turbo",
+        SYSTEM_REQUIREMENTS_SPECIFICATION_ROLE,
+        lambda text: system_requirements_specification_prompt.build(f"プロジェクト要件:\n{text}"),
+        answers,
+    )
 
 async def create_system_requirements_specification(answers):
-    template_path = os.path.join(os.path.dirname(__file__), "..", "..", "template", "System_Requirements_Specification.md")
-    with open(template_path, "r", encoding='utf-8') as f:
-        template = f.read()
-    prompt = f"""
-以下のプロジェクト要件に基づいて、システム要求仕様書の概要を作成してください。
-詳細は省略し、主要なポイントのみを簡潔に記述してください。
-
-プロジェクト要件:
-{answers}
-
-テンプレート:
-{template}
-"""
-
-    response = await aclient.chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=[
-            {"role": "system", "content": "あなたはシステム要求仕様書の専門家です。簡潔に要点をまとめてください。"},
-            {"role": "user", "content": prompt}
-        ]
+    return await create_chat_completion(
+        "gpt-3.5-turbo",
+        SYSTEM_REQUIREMENTS_SPECIFICATION_ROLE,
+        build_system_requirements_specification_prompt(answers),
+        name="create_system_requirements_specification",
     )
 
-    return response.choices[0].message.content.strip()
+def stream_system_requirements_specification(answers):
+    return stream_chat_completion(
+        "gpt-3.5-turbo",
+        SYSTEM_REQUIREMENTS_SPECIFICATION_ROLE,
+        build_system_requirements_specification_prompt(answers),
+        name="create_system_requirements_specification",
+    )
+
+def build_requirements_definition_prompt(answers):
+    return build_budgeted_prompt(
+        "create_requirements_definition",
+        "gpt-3.5-turbo",
+        REQUIREMENTS_DEFINITION_ROLE,
+        lambda text: requirements_definition_prompt.build(f"プロジェクト要件:\n{text}"),
+        answers,
+    )
 
 async def create_requirements_definition(answers):
-    template_path = os.path.join(os.path.dirname(__file__), "..", "..", "template", "Requirements_Definition.md")
-    with open(template_path, "r", encoding='utf-8') as f:
-        template = f.read()
-    prompt = f"""
-以下のプロジェクト要件に基づいて、要件定義書の概要を作成してください。
-詳細は省略し、主要なポイントのみを簡潔に記述してください。
-
-プロジェクト要件:
-{answers}
-
-テンプレート:
-{template}
-"""
-
-    response = await aclient.chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=[
-            {"role": "system", "content": "あなたは要件定義の専門家です。簡潔に要点をまとめてください。"},
-            {"role": "user", "content": prompt}
-        ]
+    return await create_chat_completion(
+        "gpt-3.5-turbo",
+        REQUIREMENTS_DEFINITION_ROLE,
+        build_requirements_definition_prompt(answers),
+        name="create_requirements_definition",
     )
 
-    return response.choices[0].message.content.strip()
\ No newline at end of file
+def stream_requirements_definition(answers):
+    return stream_chat_completion(
+        "gpt-3.5-turbo",
+        REQUIREMENTS_DEFINITION_ROLE,
+        build_requirements_definition_prompt(answers),
+        name="create_requirements_definition",
+    )
\ No newline at end of file
@@ -1,60 +1,119 @@
+import asyncio
 import logging
-from openai import AsyncOpenAI
 import os
+from pydantic import ValidationError
+from app.schemas.screen import ScreenList
+from app.services.html_preview import render_preview_html
+from app.services.llm import create_chat_completion, json_response_format
+from app.services.prompt_budget import build_budgeted_prompt
+from app.services.templates import PromptBuilder, template_registry
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-aclient = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+SCREEN_LIST_SCHEMA = ScreenList.model_json_schema()
+# 再試行時はプロンプトが変わるため、不正な応答のキャッシュには当たらない
+SCREEN_LIST_RETRY_NOTE = "\n前回の応答は指定の形式のJSONではありませんでした。指定された形式のJSONのみを返してください。\n"
+
+class MalformedScreenList(ValueError):
+    """再試行しても画面一覧のJSONとして解釈できる応答が得られなかった"""
+
+def _normalize_screens(screens):
+    names = []
+    for screen in screens:
+        screen = screen.strip("- ").strip()
+        if screen and screen not in names:
+            names.append(screen)
+    return names
+
+def validate_screen_list(content):
+    # create_chat_completion の validate に渡す。不正な応答はキャッシュされず、キャッシュにあっても使われない
+    if not _normalize_screens(ScreenList.model_validate_json(content).screens):
+        raise MalformedScreenList("The screen list is empty")
+
+def parse_screen_list(content, max_screens):
+    """{"screens": [...]} 形式の応答を検証して画面名の一覧を返す。解釈できなければ None"""
+    try:
+        screens = ScreenList.model_validate_json(content).screens
+    except ValidationError:
+        return None
+    return _normalize_screens(screens)[:max_screens] or None
+
+async def _request_screen_list(name, model, system_prompt, prompt, max_screens):
+    response_format = json_response_format(model, "screen_list", SCREEN_LIST_SCHEMA)
+    for attempt in range(2):
+        try:
+            content = await create_chat_completion(
+                model,
+                system_prompt,
+                prompt if attempt == 0 else prompt + SCREEN_LIST_RETRY_NOTE,
+                name=name,
+                response_format=response_format,
+                validate=validate_screen_list,
+            )
+        except ValueError as e:  # ValidationError と MalformedScreenList
+            logger.warning("Malformed screen list from %s (attempt %d): %s", name, attempt + 1, e)
+            continue
+        return parse_screen_list(content, max_screens)
+    # JSONを行で分割しても画面名にはならないため、解釈できなければエラーにする
+    raise MalformedScreenList(f"{name} did not return a valid screen list")
 
 async def create_screen_list(answers):
-    prompt = f"""
+    system_prompt = "あなたはUIデザインの専門家です。主要な画面のみをリストアップしてください。"
+    prompt = build_budgeted_prompt("create_screen_list", "gpt-3.5-turbo", system_prompt, lambda text: f"""
 以下のプロジェクト要件に基づいて、想定される主要な画面の一覧を作成してください。
-各画面名を簡潔に記述し、最大10個までのリストとして返してください。
+各画面名を簡潔に記述し、最大10個までを {{"screens": ["画面名", ...]}} の形式のJSONで返してください。
 
 プロジェクト要件:
-{answers}
-"""
-
-    logger.info("Sending request to OpenAI for create_screen_list with prompt: %s", prompt)
-    response = await aclient.chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=[
-            {"role": "system", "content": "あなたはUIデザインの専門家です。主要な画面のみをリストアップしてください。"},
-            {"role": "user", "content": prompt}
-        ]
-    )
-    logger.info("Received response from OpenAI for create_screen_list: %s", response)
+{text}
+""", answers)
 
-    screen_list = response.choices[0].message.content.strip().split("\n")
-    return [screen.strip("- ").strip() for screen in screen_list if screen]
+    return await _request_screen_list("create_screen_list", "gpt-3.5-turbo", system_prompt, prompt, 10)
 
 async def estimate_total_workload(answers):
-    prompt = f"""
+    system_prompt = "あなたはプロジェクトマネージャーです。大まかな工数見積もりを提供してください。"
+    prompt = build_budgeted_prompt("estimate_total_workload", "gpt-3.5-turbo", system_prompt, lambda text: f"""
 以下のプロジェクト要件に基づいて、全体の工数見積もりの概要を作成してください。
 各フェーズ（要件定義、設計、開発、テスト）の大まかな工数と合計を人日で表してください。
 
 プロジェクト要件:
-{answers}
-"""
-
-    logger.info("Sending request to OpenAI for estimate_total_workload with prompt: %s", prompt)
-    response = await aclient.chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=[
-            {"role": "system", "content": "あなたはプロジェクトマネージャーです。大まかな工数見積もりを提供してください。"},
-            {"role": "user", "content": prompt}
-        ]
+{text}
+""", answers)
+
+    content = await create_chat_completion(
+        "gpt-3.5-turbo",
+        system_prompt,
+        prompt,
+        name="estimate_total_workload",
     )
-    logger.info("Received response from OpenAI for estimate_total_workload: %s", response)
-
-    return response.choices[0].message.content.strip()
 
-async def get_screen_details(screen, answers):
-    workload = await estimate_screen_workload(screen, answers)
-    basic_design = await create_basic_design(screen, answers)
-    screen_sample = await create_screen_sample(screen, answers)
+    return content
+
+# 画面詳細生成のLLM呼び出しの同時実行数（全リクエストで共有）
+SCREEN_DETAILS_CONCURRENCY = int(os.getenv("SCREEN_DETAILS_CONCURRENCY", "9"))
+_screen_details_semaphore = None
+
+def _get_screen_details_semaphore():
+    # Python 3.9ではSemaphoreが生成時のイベントループに紐づくため、初回利用時に生成する
+    global _screen_details_semaphore
+    if _screen_details_semaphore is None:
+        _screen_details_semaphore = asyncio.Semaphore(SCREEN_DETAILS_CONCURRENCY)
+    return _screen_details_semaphore
+
+async def _limited(coro):
+    try:
+        async with _get_screen_details_semaphore():
+            return await coro
+    finally:
+        # 順番待ちの間に取り消された場合は、開始していないコルーチンを閉じる
+        coro.close()
+
+async def get_screen_details(screen, answers, limiter=_limited):
+    # limiter には先読み（screen_prefetch）用に別の同時実行数の制限を渡せる
+    workload, basic_design, screen_sample = await asyncio.gather(
+        limiter(estimate_screen_workload(screen, answers)),
+        limiter(create_basic_design(screen, answers)),
+        limiter(create_screen_sample(screen, answers)),
+    )
 
     return {
         "workload": workload,
@@ -62,108 +121,109 @@ async def get_screen_details(screen, answers):
         "screen_sample": screen_sample
     }
 
+async def _screen_details_entry(screen, answers):
+    try:
+        details = await get_screen_details(screen, answers)
+        return {"screen": screen, **details}
+    except Exception as e:
+        logger.warning("Failed to generate screen details for %s: %r", screen, e)
+        return {"screen": screen, "error": str(e)}
+
+async def get_screen_details_batch(screens, answers):
+    return await asyncio.gather(*(_screen_details_entry(screen, answers) for screen in screens))
+
+async def iter_screen_details(screens, answers):
+    # 完了した画面から順に返す
+    tasks = [asyncio.create_task(_screen_details_entry(screen, answers)) for screen in screens]
+    try:
+        for entry in asyncio.as_completed(tasks):
+            yield await entry
+    finally:
+        # クライアントが切断した場合は残りのLLM呼び出しを中断し、共有の同時実行枠を空ける
+        for task in tasks:
+            task.cancel()
+
 async def estimate_screen_workload(screen, answers):
-    prompt = f"""
+    system_prompt = "あなたはプロジェクトマネージャーです。"
+    prompt = build_budgeted_prompt("estimate_screen_workload", "gpt-3.5-turbo", system_prompt, lambda text: f"""
 以下の画面と全体のプロジェクト要件に基づいて、この画面の開発工数を見積もってください。
 工数は人日で表してください。
 
 画面名: {screen}
 プロジェクト要件:
-{answers}
-"""
-
-    logger.info("Sending request to OpenAI for estimate_screen_workload with prompt: %s", prompt)
-    response = await aclient.chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=[
-            {"role": "system", "content": "あなたはプロジェクトマネージャーです。"},
-            {"role": "user", "content": prompt}
-        ]
+{text}
+""", answers)
+
+    content = await create_chat_completion(
+        "gpt-3.5-turbo",
+        system_prompt,
+        prompt,
+        name="estimate_screen_workload",
     )
-    logger.info("Received response from OpenAI for estimate_screen_workload: %s", response)
 
-    return response.choices[0].message.content.strip()
+    return content
+
+basic_design_prompt = PromptBuilder(
+    template_registry,
+    "以下の画面と全体のプロジェクト要件に基づいて、この画面の基本設計を作成してください。\n"
+    "テンプレートに従って、各セクションを適切に埋めてください。",
+    "Basic_Design_Specification",
+)
 
 async def create_basic_design(screen, answers):
-    template_path = os.path.join(os.path.dirname(__file__), "..", "..", "template", "Basic_Design_Specification.md")
-    with open(template_path, "r", encoding='utf-8') as f:
-        template = f.read()
-    prompt = f"""
-以下の画面と全体のプロジェクト要件に基づいて、この画面の基本設計を作成してください。
-テンプレートに従って、各セクションを適切に埋めてください。
+    system_prompt = "あなたはシステム設計の専門家です。"
+    prompt = build_budgeted_prompt(
+        "create_basic_design",
+        "gpt-3.5-turbo",
+        system_prompt,
+        lambda text: basic_design_prompt.build(f"画面名: {screen}\nプロジェクト要件:\n{text}"),
+        answers,
+    )
 
-画面名: {screen}
-プロジェクト要件:
-{answers}
-
-テンプレート:
-{template}
-"""
-
-    logger.info("Sending request to OpenAI for create_basic_design with prompt: %s", prompt)
-    response = await aclient.chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=[
-            {"role": "system", "content": "あなたはシステム設計の専門家です。"},
-            {"role": "user", "content": prompt}
-        ]
+    content = await create_chat_completion(
+        "gpt-3.5-turbo",
+        system_prompt,
+        prompt,
+        name="create_basic_design",
     )
-    logger.info("Received response from OpenAI for create_basic_design: %s", response)
 
-    return response.choices[0].message.content.strip()
+    return content
 
 async def create_screen_sample(screen, answers):
-    prompt = f"""
+    system_prompt = "あなたはUIデザイナーです。"
+    prompt = build_budgeted_prompt("create_screen_sample", "gpt-3.5-turbo", system_prompt, lambda text: f"""
     以下の画面と全体のプロジェクト要件に基づいて、この画面のサンプルデザインをHTMLとTailwind CSSで作成してください。
     必要に応じてJavaScriptも含めてください。
     コードは一つのコードブロックで提供してください。
 
     画面名: {screen}
     プロジェクト要件:
-    {answers}
-    """
-
-    logger.info("Sending request to OpenAI for create_screen_sample with prompt: %s", prompt)
-    response = await aclient.chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=[
-            {"role": "system", "content": "あなたはUIデザイナーです。"},
-            {"role": "user", "content": prompt}
-        ]
+    {text}
+    """, answers)
+
+    content = await create_chat_completion(
+        "gpt-3.5-turbo",
+        system_prompt,
+        prompt,
+        name="create_screen_sample",
     )
-    logger.info("Received response from OpenAI for create_screen_sample: %s", response)
 
-    return response.choices[0].message.content.strip()
+    return render_preview_html(content)
 
 async def preview_screen_list(answers):
-    prompt = f"""
+    system_prompt = "あなたはWebサイトのUI/UXデザイン専門家です。必ず3つの主要な画面を提案してください。"
+    prompt = build_budgeted_prompt("preview_screen_list", "gpt-4o-mini", system_prompt, lambda text: f"""
 以下のプロジェクト要件に基づいて、想定される主要な画面の一覧とその機能を提示してください。
-各画面名を簡潔に記述し、必ず3つのリストとして返してください。
+各要素を「画面名: 主な機能」の形式で簡潔に記述し、必ず3つを {{"screens": [...]}} の形式のJSONで返してください。
 
 プロジェクト要件:
-{answers}
-"""
-
-    logger.info("Sending request to OpenAI for preview_screen_list with prompt: %s", prompt)
-    response = await aclient.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": "あなたはWebサイトのUI/UXデザイン専門家です。必ず3つの主要な画面を提案してください。"},
-            {"role": "user", "content": prompt}
-        ]
-    )
-    logger.info("Received response from OpenAI for preview_screen_list: %s", response)
-
-    screen_list = response.choices[0].message.content.strip().split("\n")
-    screen_list = [screen.strip("- ").strip() for screen in screen_list if screen]
-    
-    # 2つ目から4つ目の画面を取得
-    screen_list = screen_list[1:4]
-    
+{text}
+""", answers)
+
+    screen_list = await _request_screen_list("preview_screen_list", "gpt-4o-mini", system_prompt, prompt, 3)
+
     # 必ず3つの画面を返すように調整
-    if len(screen_list) > 3:
-        screen_list = screen_list[:3]
-    elif len(screen_list) < 3:
+    if len(screen_list) < 3:
         screen_list.extend(["追加画面"] * (3 - len(screen_list)))
-    
-    return screen_list
\ No newline at end of file
+
+    return screen_list
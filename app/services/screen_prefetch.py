@@ -0,0 +1,110 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+
+from app.services.llm import PRIORITY_BACKGROUND, llm_priority
+from app.services.llm_cache import llm_cache
+from app.services.metrics import screen_prefetches
+from app.services.prompt_budget import serialize_answers
+from app.services.screen import get_screen_details
+
+logger = logging.getLogger(__name__)
+
+# 見積もりの後に詳細を先読みする画面数（画面一覧の先頭から）
+SCREEN_PREFETCH_COUNT = int(os.getenv("SCREEN_PREFETCH_COUNT", "3"))
+# 先読みのLLM呼び出しの同時実行数（全セッションで共有し、/screen_details の同時実行数とは別に数える）
+SCREEN_PREFETCH_CONCURRENCY = int(os.getenv("SCREEN_PREFETCH_CONCURRENCY", "3"))
+# この秒数のあいだ同じ回答で /screen_details が呼ばれなければ、残りの先読みを取り消す
+SCREEN_PREFETCH_IDLE_TIMEOUT = float(os.getenv("SCREEN_PREFETCH_IDLE_TIMEOUT", "120"))
+
+
+def session_key(answers) -> str:
+    # 見積もりと画面詳細のリクエストは同じ回答を送るため、回答のハッシュでセッションを識別する
+    payload = json.dumps(serialize_answers(answers), ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ScreenPrefetcher:
+    """見積もりで得た画面の詳細を低い優先度で生成し、LLMのキャッシュに入れておく"""
+
+    def __init__(self, count: int = SCREEN_PREFETCH_COUNT, concurrency: int = SCREEN_PREFETCH_CONCURRENCY,
+                 idle_timeout: float = SCREEN_PREFETCH_IDLE_TIMEOUT):
+        self.count = count
+        self.concurrency = concurrency
+        self.idle_timeout = idle_timeout
+        self._sessions = {}
+        self._semaphore = None
+
+    async def _limited(self, coro):
+        # Semaphore は初回利用時のイベントループで生成する
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        try:
+            async with self._semaphore:
+                return await coro
+        finally:
+            # 順番待ちの間に取り消された場合は、開始していないコルーチンを閉じる
+            coro.close()
+
+    def start(self, answers, screens):
+        # 結果はLLMのキャッシュにしか残らないため、キャッシュが無効なら先読みしない
+        if self.count <= 0 or not screens or not llm_cache.enabled:
+            return
+        key = session_key(answers)
+        self.cancel(key, "superseded")
+        session = {"last_seen": asyncio.get_running_loop().time()}
+        session["task"] = asyncio.create_task(self._run(key, session, list(screens[:self.count]), answers))
+        self._sessions[key] = session
+
+    def touch(self, answers):
+        session = self._sessions.get(session_key(answers))
+        if session is not None:
+            session["last_seen"] = asyncio.get_running_loop().time()
+
+    def cancel(self, key: str, result: str):
+        session = self._sessions.pop(key, None)
+        if session is not None:
+            session["task"].cancel()
+            screen_prefetches.inc(result=result)
+
+    def stop(self):
+        for key in list(self._sessions):
+            self.cancel(key, "shutdown")
+
+    async def _prefetch(self, screens, answers):
+        with llm_priority(PRIORITY_BACKGROUND):
+            outputs = await asyncio.gather(
+                *(get_screen_details(screen, answers, limiter=self._limited) for screen in screens),
+                return_exceptions=True,
+            )
+        failed = [(screen, output) for screen, output in zip(screens, outputs) if isinstance(output, Exception)]
+        for screen, error in failed:
+            logger.warning("Screen detail prefetch failed for %s: %r", screen, error)
+        return not failed
+
+    async def _run(self, key, session, screens, answers):
+        loop = asyncio.get_running_loop()
+        worker = asyncio.ensure_future(self._prefetch(screens, answers))
+        try:
+            # 画面詳細のリクエストが来るたびに last_seen が延び、途絶えたら打ち切る
+            while not worker.done():
+                remaining = session["last_seen"] + self.idle_timeout - loop.time()
+                if remaining <= 0:
+                    break
+                await asyncio.wait({worker}, timeout=remaining)
+        finally:
+            # 画面詳細のリクエストが合流している呼び出しは、single-flight がそのリクエストのために続ける
+            worker.cancel()
+            if self._sessions.get(key) is session:
+                del self._sessions[key]
+        if not worker.done() or worker.cancelled():
+            result = "idle"
+        else:
+            result = "completed" if worker.result() else "failed"
+        screen_prefetches.inc(result=result)
+
+
+# アプリ全体で共有する
+screen_prefetcher = ScreenPrefetcher()
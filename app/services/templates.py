@@ -0,0 +1,104 @@
+import glob
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_DIR = os.getenv("TEMPLATE_DIR", os.path.join(os.path.dirname(__file__), "..", "template"))
+TEMPLATE_HOT_RELOAD = os.getenv("TEMPLATE_HOT_RELOAD", "false").lower() == "true"
+
+# 起動時に存在しなければエラーにするテンプレート
+REQUIRED_TEMPLATES = (
+    "System_Requirements_Specification",
+    "Requirements_Definition",
+    "Basic_Design_Specification",
+)
+
+
+class TemplateRegistry:
+    """app/template/*.md を起動時に一度だけ読み込んで保持する"""
+
+    def __init__(self, directory: str, required=(), hot_reload: bool = False):
+        self.directory = directory
+        self.required = tuple(required)
+        self.hot_reload = hot_reload
+        self.version = 0
+        self._templates = {}
+        self._mtimes = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def load(self):
+        templates = {}
+        mtimes = {}
+        for path in glob.glob(os.path.join(self.directory, "*.md")):
+            name = os.path.splitext(os.path.basename(path))[0]
+            with open(path, "r", encoding="utf-8") as f:
+                templates[name] = f.read()
+            mtimes[name] = os.path.getmtime(path)
+
+        missing = [name for name in self.required if name not in templates]
+        if missing:
+            raise FileNotFoundError(
+                f"Required templates not found in {os.path.abspath(self.directory)}: {', '.join(missing)}"
+            )
+
+        with self._lock:
+            self._templates = templates
+            self._mtimes = mtimes
+            self._loaded = True
+            self.version += 1
+        logger.info("Loaded %d templates from %s", len(templates), os.path.abspath(self.directory))
+
+    def _reload_if_changed(self, name: str):
+        path = os.path.join(self.directory, f"{name}.md")
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return
+        if mtime != self._mtimes.get(name):
+            with open(path, "r", encoding="utf-8") as f:
+                content = f.read()
+            with self._lock:
+                self._templates[name] = content
+                self._mtimes[name] = mtime
+                self.version += 1
+            logger.info("Reloaded template %s", name)
+
+    def get(self, name: str) -> str:
+        if not self._loaded:
+            self.load()
+        if self.hot_reload:
+            self._reload_if_changed(name)
+        try:
+            return self._templates[name]
+        except KeyError:
+            raise KeyError(f"Template not found: {name}") from None
+
+
+class PromptBuilder:
+    """プロンプトの静的な前置きとテンプレート部分を事前に組み立てておく"""
+
+    def __init__(self, registry: TemplateRegistry, header: str, template_name: str = None):
+        self.registry = registry
+        self.prefix = f"\n{header}\n\n"
+        self.template_name = template_name
+        self._suffix = None
+        self._suffix_version = None
+
+    @property
+    def suffix(self) -> str:
+        if self.template_name is None:
+            return "\n"
+        template = self.registry.get(self.template_name)
+        if self._suffix is None or self._suffix_version != self.registry.version:
+            self._suffix = f"\n\nテンプレート:\n{template}\n"
+            self._suffix_version = self.registry.version
+        return self._suffix
+
+    def build(self, body: str) -> str:
+        return self.prefix + body + self.suffix
+
+
+template_registry = TemplateRegistry(TEMPLATE_DIR, REQUIRED_TEMPLATES, hot_reload=TEMPLATE_HOT_RELOAD)
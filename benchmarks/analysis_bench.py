@@ -0,0 +1,73 @@
+"""感情分析・キーワード抽出の旧実装と analyze_answers のマイクロベンチマーク
+
+使い方:
+    python benchmarks/analysis_bench.py --answers 30 --repeat 200
+"""
+import argparse
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from textblob import TextBlob
+
+from app.services.analysis import analyze_answers, analyze_sentiment
+
+SAMPLE_ANSWERS = [
+    "社内の勤怠管理をWebで行えるシステムを開発したいです。スマートフォンからも打刻できるようにしたい。",
+    "ユーザー数は約300名で、管理者画面から勤怠データをCSV出力できることが必要です。",
+    "既存の給与計算システム（Excel）との連携を検討しています。",
+    ["ログイン", "打刻", "勤怠一覧", "申請承認"],
+    "We would like a simple and fast UI. The current tool is slow and hard to use.",
+    "予算は500万円程度、リリースは半年後を予定しています。",
+]
+
+
+def legacy_analyze(answers):
+    # 変更前の実装（回答ごとに TextBlob を生成し、\w+ で分割）
+    sentiment_scores = [TextBlob(str(answer)).sentiment.polarity for answer in answers.values() if isinstance(answer, str)]
+    texts = []
+    for answer in answers.values():
+        if isinstance(answer, str):
+            texts.append(answer)
+        elif isinstance(answer, list):
+            texts.extend([str(a) for a in answer])
+        else:
+            texts.append(str(answer))
+    words = re.findall(r'\w+', ' '.join(texts).lower())
+    word_freq = {}
+    for word in words:
+        if len(word) > 1:
+            word_freq[word] = word_freq.get(word, 0) + 1
+    sorted_words = sorted(word_freq.items(), key=lambda x: x[1], reverse=True)
+    return sentiment_scores, [word for word, _ in sorted_words[:10]]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--answers", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    answers = {str(i): SAMPLE_ANSWERS[i % len(SAMPLE_ANSWERS)] for i in range(args.answers)}
+    # モデル読み込みを計測から除くため一度ずつ実行しておく
+    legacy_analyze(answers)
+    analyze_answers(answers)
+
+    def analyze_uncached(answers):
+        analyze_sentiment.cache_clear()
+        return analyze_answers(answers)
+
+    # uncached: 初回の見積もり / cached: 同じ回答での再見積もり
+    for name, func in (("legacy", legacy_analyze), ("new (uncached)", analyze_uncached), ("new (cached)", analyze_answers)):
+        seconds = min(timeit.repeat(lambda: func(answers), number=args.repeat, repeat=3))
+        print(f"{name:16s} {seconds / args.repeat * 1000:8.3f} ms/call")
+
+    print("legacy keywords:", legacy_analyze(answers)[1])
+    print("new keywords:   ", analyze_answers(answers)[1])
+
+
+if __name__ == "__main__":
+    main()
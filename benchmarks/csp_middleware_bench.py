@@ -0,0 +1,103 @@
+"""CSPミドルウェアの旧実装（BaseHTTPMiddleware）とASGI実装のリクエストあたりのオーバーヘッド比較
+
+/estimate と同じ形のJSONを返すエンドポイント（LLM呼び出しなし）に対して、
+ミドルウェアなし・旧実装・新実装でそれぞれリクエストを投げ、1リクエストあたりの時間を比較する。
+計測の前に、応答の本体と Content-Security-Policy ヘッダー（SSEを含む）が期待どおりかを検証する。
+
+使い方:
+    python benchmarks/csp_middleware_bench.py --requests 2000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import httpx
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from app.middleware.content_security_policy import DEFAULT_POLICY, ContentSecurityPolicyMiddleware
+from app.schemas.estimate import CombinedEstimate
+
+# /estimate の応答と同じキー（CombinedEstimate は余分なキーを許さないため、形がずれると失敗する）
+ESTIMATE_RESPONSE = CombinedEstimate(
+    requirements_specification="要件" * 200,
+    requirements_definition="定義" * 200,
+    screens=["ログイン画面", "ダッシュボード"],
+    estimate_develop="合計 20人日",
+    analysis="分析" * 100,
+).model_dump()
+
+
+class LegacyContentSecurityPolicyMiddleware(BaseHTTPMiddleware):
+    # 変更前の実装
+    async def dispatch(self, request, call_next):
+        response = await call_next(request)
+        response.headers["Content-Security-Policy"] = DEFAULT_POLICY
+        return response
+
+
+def build_app(middleware):
+    app = FastAPI()
+
+    @app.post("/estimate")
+    async def estimate():
+        return ESTIMATE_RESPONSE
+
+    @app.get("/stream")
+    async def stream():
+        async def events():
+            for i in range(5):
+                yield f"data: {i}\n\n"
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    if middleware is not None:
+        app.add_middleware(middleware)
+    return app
+
+
+async def measure(app, requests: int, expected_policy) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        # ストリーミングが途切れずに届き、ヘッダーも付くことを確認する
+        response = await client.get("/stream")
+        assert response.text.count("data:") == 5, response.text
+        assert response.headers.get("content-security-policy") == expected_policy, response.headers
+        for _ in range(50):
+            response = await client.post("/estimate", json={"answers": {}})
+            assert response.headers.get("content-security-policy") == expected_policy, response.headers
+            assert response.json() == ESTIMATE_RESPONSE
+        started = time.perf_counter()
+        for _ in range(requests):
+            response = await client.post("/estimate", json={"answers": {}})
+        elapsed = time.perf_counter() - started
+        assert response.status_code == 200
+    return elapsed / requests
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    variants = [
+        ("no middleware", None),
+        ("BaseHTTPMiddleware", LegacyContentSecurityPolicyMiddleware),
+        ("pure ASGI", ContentSecurityPolicyMiddleware),
+    ]
+    baseline = None
+    for label, middleware in variants:
+        app = build_app(middleware)
+        expected_policy = None if middleware is None else DEFAULT_POLICY
+        per_request = min([await measure(app, args.requests, expected_policy) for _ in range(args.rounds)])
+        baseline = per_request if baseline is None else baseline
+        print(f"{label:20s} {per_request * 1e6:8.1f} us/request  (+{(per_request - baseline) * 1e6:6.1f} us)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
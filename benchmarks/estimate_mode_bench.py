@@ -0,0 +1,80 @@
+"""generate_estimate の fan-out モード（5回呼び出し）と combined モード（構造化出力1回）の比較
+
+mock_llm_server.py（またはOpenAI互換のエンドポイント）に対して実行し、
+1見積もりあたりのレイテンシと、プロンプト・出力のトークン数を比較する:
+
+    python benchmarks/mock_llm_server.py --latency-mean 0.5 --char-latency 0.002 &
+    OPENAI_BASE_URL=http://localhost:8001/v1 OPENAI_API_KEY=dummy python benchmarks/estimate_mode_bench.py --iterations 10
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.services.estimate import generate_estimate
+from app.services.llm import close_client
+from app.services.metrics import llm_tokens
+from app.services.templates import template_registry
+
+SAMPLE_ANSWERS = {
+    "1": "社内の勤怠管理をWebで行えるシステムを開発したいです。スマートフォンからも打刻できるようにしたい。",
+    "2": "ユーザー数は約300名で、管理者画面から勤怠データをCSV出力できることが必要です。",
+    "3": ["ログイン", "打刻", "勤怠一覧", "申請承認"],
+    "4": "既存の給与計算システム（Excel）との連携を検討しています。",
+    "5": "予算は500万円程度、リリースは半年後を予定しています。",
+}
+
+
+def token_totals():
+    # llm_tokens は (name, model, type) ごとに集計されているので種別ごとに合計する
+    totals = {"prompt": 0, "completion": 0}
+    for (_, _, kind), value in list(llm_tokens._values.items()):
+        totals[kind] = totals.get(kind, 0) + value
+    return totals
+
+
+async def run_mode(mode: str, iterations: int):
+    latencies = []
+    before = token_totals()
+    for i in range(iterations):
+        # キャッシュに当たらないよう毎回回答を変える
+        answers = {**SAMPLE_ANSWERS, "99": f"{mode}-{i}-{time.time_ns()}"}
+        started = time.perf_counter()
+        await generate_estimate(answers, mode=mode)
+        latencies.append(time.perf_counter() - started)
+    after = token_totals()
+    return {
+        "mode": mode,
+        "mean_s": statistics.mean(latencies),
+        "p50_s": statistics.median(latencies),
+        "max_s": max(latencies),
+        "prompt_tokens": (after["prompt"] - before["prompt"]) / iterations,
+        "completion_tokens": (after["completion"] - before["completion"]) / iterations,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--modes", default="fanout,combined")
+    args = parser.parse_args()
+
+    template_registry.load()
+    try:
+        for mode in args.modes.split(","):
+            result = await run_mode(mode.strip(), args.iterations)
+            print(
+                f"{result['mode']:9s} mean={result['mean_s'] * 1000:7.0f}ms p50={result['p50_s'] * 1000:7.0f}ms "
+                f"max={result['max_s'] * 1000:7.0f}ms prompt_tokens={result['prompt_tokens']:7.0f} "
+                f"completion_tokens={result['completion_tokens']:6.0f} (per estimate)"
+            )
+    finally:
+        await close_client()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
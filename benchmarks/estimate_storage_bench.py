@@ -0,0 +1,118 @@
+"""estimate_data の生成ドキュメントの保存形式（none / zlib / zstd / zstd+辞書）の比較
+
+テンプレートを元にしたドキュメントを入れた一時的なSQLiteのDBを形式ごとに作り、
+DBファイルのサイズ、一覧の取得（長文カラムを読まない）と詳細の取得（展開を含む）の時間を比較する:
+
+    pip install zstandard
+    python benchmarks/estimate_storage_bench.py --rows 2000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import Session, load_only, undefer_group
+
+from app.database import Base
+from app.models.estimate import Estimate
+from app.services import compression
+from app.services.estimate_search import SUMMARY_COLUMNS
+from app.services.templates import TEMPLATE_DIR
+
+WORDS = ["勤怠", "打刻", "申請", "承認", "CSV出力", "ログイン", "管理者", "通知", "検索", "集計", "権限", "帳票"]
+
+
+def make_document(rng: random.Random, template: str) -> str:
+    # テンプレートの各行に案件ごとに異なる記述を付け足して、生成結果に近いドキュメントにする
+    lines = []
+    for line in template.splitlines():
+        lines.append(line)
+        if line.strip() and not line.startswith("#"):
+            lines.append("".join(rng.choice(WORDS) for _ in range(rng.randint(3, 12))) + "を行う。")
+    return "\n".join(lines)
+
+
+def make_rows(rng: random.Random, templates, rows: int):
+    for i in range(rows):
+        yield {
+            "name": f"user{i}",
+            "email": f"user{i}@example.com",
+            "inquiry": "".join(rng.choice(WORDS) for _ in range(20)),
+            "requirements_specification": make_document(rng, templates[0]),
+            "requirements_definition": make_document(rng, templates[1]),
+            "screens": rng.sample(WORDS, 5),
+            "estimate_develop": make_document(rng, templates[2]),
+            "answers": {"1": "".join(rng.choice(WORDS) for _ in range(30))},
+        }
+
+
+def measure(path: str, rows, repeat: int):
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    with Session(engine) as db:
+        db.execute(insert(Estimate), rows)
+        db.commit()
+    engine.dispose()
+    size = os.path.getsize(path)
+
+    with Session(engine) as db:
+        started = time.perf_counter()
+        for _ in range(repeat):
+            db.execute(select(Estimate).options(load_only(*SUMMARY_COLUMNS)).order_by(Estimate.id.desc()).limit(20)).scalars().all()
+            db.expunge_all()
+        list_time = (time.perf_counter() - started) / repeat
+
+        ids = [row.id for row in db.execute(select(Estimate.id)).all()]
+        started = time.perf_counter()
+        for estimate_id in ids[:repeat]:
+            row = db.get(Estimate, estimate_id, options=[undefer_group("documents")])
+            assert row.requirements_specification.startswith("#")
+        detail_time = (time.perf_counter() - started) / min(repeat, len(ids))
+    engine.dispose()
+    return size, list_time, detail_time
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    templates = []
+    for name in ("System_Requirements_Specification", "Requirements_Definition", "Basic_Design_Specification"):
+        with open(os.path.join(TEMPLATE_DIR, f"{name}.md"), "r", encoding="utf-8") as f:
+            templates.append(f.read())
+    rows = list(make_rows(random.Random(args.seed), templates, args.rows))
+
+    codecs = [("none", compression.DocumentCodec("none")), ("zlib", compression.DocumentCodec("zlib"))]
+    if compression._import_zstd() is None:
+        print("zstandard is not installed; skipping zstd")
+    else:
+        # 辞書は計測に使う行とは別に生成したドキュメントで学習する
+        samples = compression.template_samples(TEMPLATE_DIR)
+        for row in make_rows(random.Random(args.seed + 1), templates, 200):
+            samples.extend(row[column].encode("utf-8") for column in ("requirements_specification", "requirements_definition", "estimate_develop"))
+        dictionary = compression.train_dictionary(samples)
+        codecs += [("zstd", compression.DocumentCodec("zstd")), ("zstd+dict", compression.DocumentCodec("zstd", [dictionary]))]
+
+    baseline = None
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, codec in codecs:
+            compression.document_codec = codec
+            size, list_time, detail_time = measure(os.path.join(tmp, f"{label}.db"), rows, args.repeat)
+            baseline = size if baseline is None else baseline
+            print(
+                f"{label:10s} {size / 1024 / 1024:8.2f} MiB ({size / baseline:5.1%})"
+                f"  list {list_time * 1e3:7.3f} ms  detail {detail_time * 1e3:7.3f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
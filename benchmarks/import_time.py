@@ -0,0 +1,69 @@
+"""app.main の読み込み時間を `python -X importtime` で計測し、予算を超えたら失敗させる
+
+使い方:
+    python benchmarks/import_time.py --budget-ms 1000 --runs 3
+
+起動時に読み込んではいけない重いモジュール（openai, textblob, nltk）が
+読み込まれていた場合も失敗とする。CIでは .github/workflows/checks.yml から実行する。
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+DEFERRED_MODULES = ("openai", "textblob", "nltk")
+
+
+def measure():
+    env = dict(os.environ)
+    env.setdefault("OPENAI_API_KEY", "benchmark")
+    env.setdefault("DATABASE_URL", "sqlite://")
+    env["PYTHONPATH"] = ROOT
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    )
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        try:
+            self_us, cumulative_us = int(parts[0]), int(parts[1])
+        except ValueError:
+            continue
+        modules[parts[2].strip()] = (self_us, cumulative_us)
+    return modules
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("IMPORT_TIME_BUDGET_MS", "1000")))
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    runs = [measure() for _ in range(args.runs)]
+    best = min(runs, key=lambda modules: modules["app.main"][1])
+    total_ms = best["app.main"][1] / 1000
+
+    print(f"import app.main: {total_ms:.1f} ms (best of {args.runs}, budget {args.budget_ms:.0f} ms)")
+    print("slowest modules (cumulative):")
+    top_level = sorted(((cumulative, name) for name, (_, cumulative) in best.items() if "." not in name), reverse=True)
+    for cumulative, name in top_level[:args.top]:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+    failed = False
+    loaded = [name for name in DEFERRED_MODULES if name in best]
+    if loaded:
+        print(f"FAIL: modules that should be imported lazily were loaded at startup: {', '.join(loaded)}")
+        failed = True
+    if total_ms > args.budget_ms:
+        print(f"FAIL: import time {total_ms:.1f} ms exceeds budget {args.budget_ms:.0f} ms")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
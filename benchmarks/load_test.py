@@ -0,0 +1,126 @@
+"""/estimate, /preview, /screen_details の負荷試験
+
+mock_llm_server.py を OPENAI_BASE_URL に指定して起動したアプリに対して実行する:
+
+    python benchmarks/load_test.py --base-url http://localhost:8000 --endpoints estimate,preview,screen_details \\
+        --requests 100 --concurrency 20 --seed 1 --output bench_result.json
+
+--unique-answers を付けると毎回異なる回答を送り、LLMキャッシュを効かせない状態で計測する。
+--max-p95-ms を指定すると、いずれかのエンドポイントのp95が超えた場合に終了コード1で終わる。
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+
+import httpx
+
+BASE_ANSWERS = {
+    "1": "社内の勤怠管理をWebで行えるシステムを開発したい",
+    "2": "ユーザー数は約300名",
+    "3": ["ログイン", "打刻", "勤怠一覧", "申請承認"],
+    "4": "予算は500万円程度",
+}
+
+
+def make_answers(rng: random.Random, unique: bool):
+    answers = dict(BASE_ANSWERS)
+    if unique:
+        answers["request_id"] = f"{rng.getrandbits(64):016x}"
+    return answers
+
+
+def build_request(endpoint: str, answers):
+    if endpoint == "estimate":
+        return "/estimate", {"answers": answers}
+    if endpoint == "preview":
+        return "/preview", {"answers": answers}
+    if endpoint == "screen_details":
+        return "/screen_details", {"screen": "ログイン画面", "answers": answers}
+    raise ValueError(f"Unknown endpoint: {endpoint}")
+
+
+def percentile(values, q: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+async def run_endpoint(client, endpoint: str, args, rng: random.Random):
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+    errors = 0
+
+    async def one():
+        nonlocal errors
+        path, payload = build_request(endpoint, make_answers(rng, args.unique_answers))
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                response = await client.post(path, json=payload)
+                if response.status_code >= 400:
+                    errors += 1
+                    return
+            except httpx.HTTPError:
+                errors += 1
+                return
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(args.requests)))
+    elapsed = time.perf_counter() - started
+    return {
+        "endpoint": endpoint,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--endpoints", default="estimate,preview,screen_details")
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--unique-answers", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--output", help="結果をJSONで書き出すパス")
+    parser.add_argument("--max-p95-ms", type=float, help="p95の上限（超えたら終了コード1）")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    results = []
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        for endpoint in args.endpoints.split(","):
+            result = await run_endpoint(client, endpoint.strip(), args, rng)
+            results.append(result)
+            print(
+                f"{result['endpoint']:15s} rps={result['rps']:7.2f} p50={result['p50_ms']:8.1f}ms "
+                f"p95={result['p95_ms']:8.1f}ms p99={result['p99_ms']:8.1f}ms errors={result['errors']}"
+            )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+    if args.max_p95_ms is not None:
+        slow = [result["endpoint"] for result in results if result["p95_ms"] > args.max_p95_ms]
+        if slow:
+            print(f"FAIL: p95 exceeds {args.max_p95_ms:.0f} ms for {', '.join(slow)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,150 @@
+"""OpenAI互換の /v1/chat/completions を返すローカルのスタブサーバー
+
+実際のOpenAI APIを呼ばずに負荷試験を行うために使う。
+アプリ側は OPENAI_BASE_URL を向けるだけでよい:
+
+    python benchmarks/mock_llm_server.py --port 8001 --latency-dist lognormal --latency-mean 1.5 --failure-rate 0.01
+    OPENAI_BASE_URL=http://localhost:8001/v1 OPENAI_API_KEY=dummy uvicorn app.main:app --port 8000
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+SCREEN_NAMES = ["ログイン画面", "ダッシュボード", "一覧画面", "詳細画面", "登録・編集画面", "設定画面", "レポート画面"]
+
+config = argparse.Namespace(
+    latency_dist="fixed", latency_mean=0.5, latency_sigma=0.5, latency_max=30.0,
+    failure_rate=0.0, rate_limit_rate=0.0, token_interval=0.01, char_latency=0.0, completion_chars=600, seed=None,
+)
+rng = random.Random()
+app = FastAPI()
+
+
+def sample_latency() -> float:
+    if config.latency_dist == "uniform":
+        latency = rng.uniform(0, 2 * config.latency_mean)
+    elif config.latency_dist == "lognormal":
+        # 平均が latency_mean になるように mu を決める
+        mu = math.log(config.latency_mean) - config.latency_sigma ** 2 / 2
+        latency = rng.lognormvariate(mu, config.latency_sigma)
+    elif config.latency_dist == "exponential":
+        latency = rng.expovariate(1 / config.latency_mean)
+    else:
+        latency = config.latency_mean
+    return min(latency, config.latency_max)
+
+
+def filler_text() -> str:
+    line = "これはモックサーバーが生成したダミーの応答です。"
+    return (line * (config.completion_chars // len(line) + 1))[:config.completion_chars]
+
+
+def build_structured_content(schema) -> str:
+    # JSONスキーマ指定の呼び出しには、スキーマの各プロパティを埋めたJSONを返す
+    result = {}
+    for name, prop in schema.get("properties", {}).items():
+        result[name] = SCREEN_NAMES if prop.get("type") == "array" else filler_text()
+    return json.dumps(result, ensure_ascii=False)
+
+
+def build_content(prompt: str, response_format=None) -> str:
+    response_type = (response_format or {}).get("type")
+    if response_type == "json_schema":
+        return build_structured_content(response_format["json_schema"].get("schema", {}))
+    # 画面一覧を求めるプロンプトには箇条書き（JSONモードでは {"screens": [...]}）を、それ以外には指定文字数程度の文章を返す
+    if "画面の一覧" in prompt:
+        if response_type == "json_object":
+            return json.dumps({"screens": SCREEN_NAMES}, ensure_ascii=False)
+        return "\n".join(f"- {name}" for name in SCREEN_NAMES)
+    if response_type == "json_object":
+        return json.dumps({"content": filler_text()}, ensure_ascii=False)
+    return filler_text()
+
+
+def error_response():
+    roll = rng.random()
+    if roll < config.rate_limit_rate:
+        return JSONResponse(
+            {"error": {"message": "Rate limit reached (mock)", "type": "rate_limit_error"}},
+            status_code=429, headers={"retry-after": "1"},
+        )
+    if roll < config.rate_limit_rate + config.failure_rate:
+        return JSONResponse({"error": {"message": "Internal error (mock)", "type": "server_error"}}, status_code=500)
+    return None
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    error = error_response()
+    if error is not None:
+        return error
+
+    prompt = "\n".join(message.get("content", "") for message in body.get("messages", []))
+    content = build_content(prompt, body.get("response_format"))
+    model = body.get("model", "mock")
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    usage = {"prompt_tokens": len(prompt), "completion_tokens": len(content), "total_tokens": len(prompt) + len(content)}
+
+    if not body.get("stream"):
+        # 生成時間は出力の長さに比例させる（--char-latency）
+        await asyncio.sleep(sample_latency() + len(content) * config.char_latency)
+        return {
+            "id": completion_id, "object": "chat.completion", "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": usage,
+        }
+
+    async def stream():
+        # 最初のトークンまでのレイテンシの後、一定間隔でチャンクを送る
+        await asyncio.sleep(sample_latency())
+        for start in range(0, len(content), 8):
+            chunk = {
+                "id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "delta": {"content": content[start:start + 8]}, "finish_reason": None}],
+            }
+            yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+            await asyncio.sleep(config.token_interval)
+        done = {
+            "id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+        }
+        yield f"data: {json.dumps(done)}\n\n"
+        if (body.get("stream_options") or {}).get("include_usage"):
+            yield f"data: {json.dumps({'id': completion_id, 'object': 'chat.completion.chunk', 'created': int(time.time()), 'model': model, 'choices': [], 'usage': usage})}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency-dist", choices=["fixed", "uniform", "lognormal", "exponential"], default="fixed")
+    parser.add_argument("--latency-mean", type=float, default=0.5, help="平均レイテンシ（秒）")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="lognormal のばらつき")
+    parser.add_argument("--latency-max", type=float, default=30.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="500を返す割合")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="429を返す割合")
+    parser.add_argument("--token-interval", type=float, default=0.01, help="ストリーミング時のチャンク間隔（秒）")
+    parser.add_argument("--char-latency", type=float, default=0.0, help="非ストリーミング時に出力1文字あたり加算する秒数")
+    parser.add_argument("--completion-chars", type=int, default=600)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    vars(config).update({key: value for key, value in vars(args).items() if key not in ("host", "port")})
+    rng.seed(args.seed)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
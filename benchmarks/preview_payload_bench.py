@@ -0,0 +1,96 @@
+"""/preview のレスポンスサイズの比較（LLMの応答そのまま / 整形後 / 共通アセットの分離 / gzip・brotli）
+
+LLMが返す形（説明文とコードブロック、インデント付きのHTML）のプレビューを3画面分作り、
+各段階でのJSONのサイズと整形にかかる時間を表示する:
+
+    python benchmarks/preview_payload_bench.py
+"""
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from app.middleware import compression
+from app.services.html_preview import minify_html, extract_code_block, split_shared_assets
+
+SCREEN_TEMPLATE = """以下が{name}のサンプルデザインです。
+
+```html
+<!DOCTYPE html>
+<html lang="ja">
+    <head>
+        <meta charset="UTF-8">
+        <meta name="viewport" content="width=device-width, initial-scale=1.0">
+        <title>{name}</title>
+        <script src="https://cdn.tailwindcss.com"></script>
+    </head>
+    <body class="bg-gray-100">
+        <!-- ヘッダー -->
+        <header class="bg-white shadow">
+            <div class="max-w-7xl mx-auto py-6 px-4">
+                <h1 class="text-3xl font-bold text-gray-900">{name}</h1>
+            </div>
+        </header>
+        <main class="max-w-7xl mx-auto py-6 px-4">
+{rows}
+        </main>
+        <script>
+            document.querySelectorAll('a').forEach(function (link) {{
+                link.addEventListener('click', function (event) {{
+                    event.preventDefault();
+                    alert('画面遷移が実行されます');
+                }});
+            }});
+        </script>
+    </body>
+</html>
+```
+
+ボタンとリンクにはアラートを設定しています。"""
+
+ROW_TEMPLATE = """            <div class="bg-white rounded-lg shadow p-4 mb-4">
+                <label for="field{i}" class="block text-sm font-medium text-gray-700">項目{i}</label>
+                <input id="field{i}" type="text" class="mt-1 block w-full border-gray-300 rounded-md">
+                <button id="button{i}" class="mt-2 bg-blue-500 text-white px-4 py-2 rounded" onclick="alert('項目{i}の保存が実行されます')">保存</button>
+            </div>"""
+
+
+def make_screen(name: str, rows: int) -> str:
+    return SCREEN_TEMPLATE.format(name=name, rows="\n".join(ROW_TEMPLATE.format(i=i) for i in range(rows)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=15, help="1画面あたりのフォームの行数")
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    raw = [make_screen(name, args.rows) for name in ("ログイン画面", "ダッシュボード", "設定画面")]
+
+    started = time.perf_counter()
+    for _ in range(args.iterations):
+        processed = [minify_html(extract_code_block(content)) for content in raw]
+    render_time = (time.perf_counter() - started) / args.iterations
+    assets, shared = split_shared_assets(processed)
+
+    variants = [
+        ("raw markdown", [{"preview": content} for content in raw]),
+        ("code block + minify", [{"preview": html} for html in processed]),
+        ("shared assets", {"assets": assets, "screens": [{"preview": html} for html in shared]}),
+    ]
+    for label, payload in variants:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        line = f"{label:22s} {len(body):8d} bytes  gzip {len(gzip.compress(body, compression.COMPRESSION_GZIP_LEVEL)):7d}"
+        if compression.brotli is not None:
+            line += f"  br {len(compression.brotli.compress(body, quality=compression.COMPRESSION_BROTLI_QUALITY)):7d}"
+        print(line)
+    print(f"post-processing: {render_time * 1e3:.3f} ms for {len(raw)} screens")
+
+
+if __name__ == "__main__":
+    main()
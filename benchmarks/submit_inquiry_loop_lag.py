@@ -0,0 +1,116 @@
+"""/submit_inquiry の同時リクエスト中にイベントループがどれだけ止まるかを計測する
+
+使い方:
+    python benchmarks/submit_inquiry_loop_lag.py --requests 200 --concurrency 50 --db-latency 0.05
+    python benchmarks/submit_inquiry_loop_lag.py --blocking   # 旧実装（ループ上でcommit）と比較
+
+--max-lag-ms を指定すると、イベントループの最大遅延がそれを超えた場合に終了コード1で失敗する
+（CIでは .github/workflows/checks.yml から実行する）。
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--db-latency", type=float, default=0.05, help="1クエリごとに加える擬似的なDB往復時間（秒）")
+    parser.add_argument("--blocking", action="store_true", help="commitをイベントループ上で実行する（旧実装）")
+    parser.add_argument("--max-lag-ms", type=float, help="イベントループの最大遅延の上限（超えたら失敗）")
+    return parser.parse_args()
+
+
+async def measure_loop_lag(stop: asyncio.Event, interval: float = 0.01):
+    lags = []
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lags.append(loop.time() - start - interval)
+    return lags
+
+
+async def main():
+    args = parse_args()
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mktemp(suffix='.db')}"
+
+    import httpx
+    from sqlalchemy import event
+    from app.database import Base, engine
+    from app.main import app
+    from app.services import estimate as estimate_service
+
+    @event.listens_for(engine, "connect")
+    def autocommit(dbapi_connection, _):
+        # SQLite固有のロック待ちを避けるため、各文を即時コミットさせる
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def simulate_latency(*_):
+        time.sleep(args.db_latency)
+
+    # ASGITransport は lifespan を実行しないため、テーブルはここで作る
+    Base.metadata.create_all(engine)
+
+    if args.blocking:
+        # 旧実装と同じく、ループ上でcommitしてその場でセッションを閉じる
+        async def run_inline(func, db, *a):
+            try:
+                return func(db, *a)
+            finally:
+                db.close()
+        estimate_service.run_db = run_inline
+
+    payload = {
+        "name": "benchmark",
+        "email": "bench@example.com",
+        "message": "load test",
+        "simulationResult": {
+            "requirements_specification": "spec",
+            "requirements_definition": "definition",
+            "screens": ["ログイン", "ダッシュボード"],
+            "estimate_develop": "10人日",
+            "answers": {"1": "テスト"},
+        },
+    }
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def submit():
+            async with semaphore:
+                response = await client.post("/submit_inquiry", json=payload)
+                assert response.status_code == 200, response.text
+
+        stop = asyncio.Event()
+        lag_task = asyncio.create_task(measure_loop_lag(stop))
+        started = time.perf_counter()
+        await asyncio.gather(*(submit() for _ in range(args.requests)))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        lags = sorted(await lag_task)
+
+    mode = "blocking" if args.blocking else "threadpool"
+    print(f"mode={mode} requests={args.requests} concurrency={args.concurrency} db_latency={args.db_latency}s")
+    print(f"elapsed={elapsed:.2f}s throughput={args.requests / elapsed:.1f} req/s")
+    if lags:
+        p99 = lags[int(len(lags) * 0.99) - 1] if len(lags) > 1 else lags[0]
+        print(f"event loop lag: max={max(lags) * 1000:.1f}ms p99={p99 * 1000:.1f}ms samples={len(lags)}")
+    if args.max_lag_ms is not None:
+        # 1回のDB往復（db_latency）分でもループが止まれば超える上限を指定する
+        max_lag_ms = max(lags) * 1000 if lags else 0.0
+        if not lags or max_lag_ms > args.max_lag_ms:
+            print(f"FAIL: event loop lag {max_lag_ms:.1f}ms exceeds {args.max_lag_ms:.0f}ms")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,7 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+# LLM・DBには接続しない
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("OPENAI_API_KEY", "dummy")
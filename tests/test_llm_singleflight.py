@@ -0,0 +1,127 @@
+"""SingleFlight のキャンセルと、合流した呼び出し元による優先度の引き上げのテスト"""
+import asyncio
+import time
+import types
+
+from app.services import llm
+
+
+class Upstream:
+    """release() されるまで完了しない上流の呼び出し"""
+
+    def __init__(self, result="ok"):
+        self.result = result
+        self.started = 0
+        self.cancelled = 0
+        self._released = None
+
+    async def __call__(self):
+        if self._released is None:
+            self._released = asyncio.Event()
+        self.started += 1
+        try:
+            await self._released.wait()
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return self.result
+
+    def release(self):
+        self._released.set()
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_last_waiter_cancels_upstream_call():
+    async def main():
+        flight = llm.SingleFlight()
+        upstream = Upstream()
+        caller = asyncio.create_task(flight.do("key", upstream))
+        await _settle()
+        caller.cancel()
+        await asyncio.gather(caller, return_exceptions=True)
+        await _settle()
+        assert upstream.cancelled == 1
+        assert flight.stats()["in_flight"] == 0
+
+    asyncio.run(main())
+
+
+def test_remaining_waiter_gets_result_after_first_is_cancelled():
+    async def main():
+        flight = llm.SingleFlight()
+        upstream = Upstream()
+        first = asyncio.create_task(flight.do("key", upstream))
+        second = asyncio.create_task(flight.do("key", upstream))
+        await _settle()
+        first.cancel()
+        await asyncio.gather(first, return_exceptions=True)
+        upstream.release()
+        assert await second == "ok"
+        assert upstream.started == 1
+        assert upstream.cancelled == 0
+        assert flight.stats() == {"calls": 1, "deduplicated": 1, "in_flight": 0}
+
+    asyncio.run(main())
+
+
+def test_late_joiner_does_not_attach_to_cancelled_flight():
+    async def main():
+        flight = llm.SingleFlight()
+        abandoned = Upstream("abandoned")
+        caller = asyncio.create_task(flight.do("key", abandoned))
+        await _settle()
+        caller.cancel()
+        await asyncio.sleep(0)  # 呼び出し元の finally で上流の取り消しを要求した直後
+        assert abandoned.cancelled == 0  # 上流のタスクはまだ取り消しを処理していない
+
+        fresh = Upstream("fresh")
+        late = asyncio.create_task(flight.do("key", fresh))
+        await _settle()
+        fresh.release()
+        assert await late == "fresh"
+        assert abandoned.cancelled == 1
+        assert flight.stats()["calls"] == 2
+
+    asyncio.run(main())
+
+
+def test_interactive_joiner_raises_priority_of_queued_background_call(monkeypatch):
+    served = []
+
+    class FakeCompletions:
+        @staticmethod
+        async def create(model, messages, **kwargs):
+            served.append(messages[-1]["content"])
+            message = types.SimpleNamespace(content=messages[-1]["content"])
+            return types.SimpleNamespace(usage=None, choices=[types.SimpleNamespace(message=message)])
+
+    client = types.SimpleNamespace(chat=types.SimpleNamespace(completions=FakeCompletions))
+    monkeypatch.setattr(llm, "_client", client)
+    monkeypatch.setattr(llm.llm_cache, "enabled", False)
+
+    async def main():
+        llm._retryable_errors()  # openai の初回読み込みの間にバケットが補充されないよう、先に読み込んでおく
+        # 1リクエスト0.1秒ごとにしか通さない、空のバケット
+        scheduler = llm.RateLimitScheduler(600, 0)
+        scheduler._requests = 0
+        scheduler._updated = time.monotonic()
+        monkeypatch.setitem(llm._schedulers, "test-model", scheduler)
+
+        with llm.llm_priority(llm.PRIORITY_BACKGROUND):
+            background = [
+                asyncio.create_task(llm.create_chat_completion("test-model", "system", prompt))
+                for prompt in ("first", "second")
+            ]
+        await _settle()
+        assert [entry[0] for entry in scheduler._waiters] == [llm.PRIORITY_BACKGROUND] * 2
+
+        # 後から投入された "second" に対話的な呼び出し元が合流すると、先に実行される
+        assert await llm.create_chat_completion("test-model", "system", "second") == "second"
+        await asyncio.gather(*background)
+        assert served == ["second", "first"]
+
+    asyncio.run(main())